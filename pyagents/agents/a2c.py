@@ -26,6 +26,7 @@ class A2C(OnPolicyAgent):
                  lam_gae: float = 0.9,
                  entropy_coef: float = 1e-3,
                  gradient_clip_norm: Optional[float] = 0.5,
+                 jit_compile: bool = True,
                  training: bool = True,
                  log_dict: dict = None,
                  name: str = 'A2C',
@@ -49,6 +50,7 @@ class A2C(OnPolicyAgent):
               by accumulating gradients over multiple backward passes. Defaults to 0 (no accumulation).
             entropy_coef: (Optional) Coefficient applied to entropy loss. Defaults to 1e-3.
             gradient_clip_norm: (Optional) Global norm for gradient clipping, pass None to disable. Defaults to 0.5.
+            jit_compile: (Optional) If True, the training steps are compiled with XLA. Defaults to True.
             training: (Optional) If True, agent is in training phase. Defaults to True.
             log_dict: (Optional) Additional dict of config parameters that should be logged by WandB. Defaults to None.
             name: (Optional) Name of the agent.
@@ -79,11 +81,15 @@ class A2C(OnPolicyAgent):
         self._entropy_coef = entropy_coef
         self._standardize = standardize
         self._gradient_clip_norm = gradient_clip_norm
+        # all gradient steps of a training phase are unrolled and fused into a single graph
+        self._update_rounds = tf.function(self._update_rounds, jit_compile=jit_compile)
+        self._state_values = tf.function(self._state_values, jit_compile=jit_compile)
 
         self.config.update({
             'gamma': self.gamma,
             'n_step_return': self._n_step_return,
-            'entropy_coef': self._entropy_coef
+            'entropy_coef': self._entropy_coef,
+            'jit_compile': jit_compile
         })
 
         if wandb_params:
@@ -113,6 +119,46 @@ class A2C(OnPolicyAgent):
         critic_loss = self._critic_loss_fn(delta, ac_out.critic_values)
         return policy_loss, critic_loss, entropy_loss
 
+    def _state_values(self, states, next_states):
+        """Returns critic values of states and next states, computed with a single forward pass.
+
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
+        values = self._actor_critic(tf.concat([states, next_states], axis=0)).critic_values
+        return tf.split(values, 2, axis=0)
+
+    def _update(self, states, actions, delta):
+        """Performs a single gradient step given a minibatch of the current trajectory."""
+        with tf.GradientTape() as tape:
+            policy_loss, critic_loss, entropy_loss = self._loss((states, actions, delta))
+            loss = policy_loss + critic_loss - entropy_loss
+        grads = tape.gradient(loss, self._actor_critic.trainable_variables)
+        if self._gradient_clip_norm is not None:
+            grads, norm = tf.clip_by_global_norm(grads, self._gradient_clip_norm)
+        self._opt.apply_gradients(list(zip(grads, self._actor_critic.trainable_variables)))
+        return {'loss': loss,
+                'policy_loss': policy_loss,
+                'critic_loss': critic_loss,
+                'entropy_loss': entropy_loss}
+
+    def _update_rounds(self, states, actions, delta, batch_size, update_rounds):
+        """Performs update_rounds passes over the current trajectory, with a gradient step for each shuffled minibatch.
+
+        This method is wrapped into a tf.function at construction time: batch_size and update_rounds are
+        python integers, so that all gradient steps are unrolled into a single graph and executed in one call.
+        """
+        n_samples = states.shape[0]
+        finite_losses = tf.constant(True)
+        for _ in range(update_rounds):
+            indexes = tf.random.shuffle(tf.range(n_samples))
+            for start in range(0, n_samples, batch_size):
+                batch_indexes = indexes[start:start + batch_size]
+                update_info = self._update(tf.gather(states, batch_indexes, axis=0),
+                                           tf.gather(actions, batch_indexes, axis=0),
+                                           tf.gather(delta, batch_indexes, axis=0))
+                finite_losses = tf.logical_and(finite_losses, tf.math.is_finite(update_info['loss']))
+        return {**update_info, 'finite_losses': finite_losses}
+
     def _train(self, batch_size, update_rounds, *args, **kwargs) -> dict:
         states = tf.convert_to_tensor(self._memory['states'], dtype=tf.float32)
         actions = tf.convert_to_tensor(self._memory['actions'], dtype=tf.float32)
@@ -122,38 +168,18 @@ class A2C(OnPolicyAgent):
         actions = tf.reshape(actions, (-1,))
         next_states = tf.reshape(next_states, (-1, *self.state_shape))
         # GAE computation
-        state_values = self._actor_critic(states).critic_values
-        next_state_values = self._actor_critic(next_states).critic_values
-        delta = tf.stop_gradient(self.compute_gae(state_values, next_state_values))
+        state_values, next_state_values = self._state_values(states, next_states)
+        _, delta = self.compute_gae(state_values, next_state_values)
         if self._standardize:
             delta = ((delta - tf.math.reduce_mean(delta)) / (tf.math.reduce_std(delta) + self.eps))
 
-        indexes = np.arange(states.shape[0])
-        for _ in range(update_rounds):
-            np.random.shuffle(indexes)
-            for start in range(0, states.shape[0], batch_size):
-                end = start + batch_size
-                batch_indexes = indexes[start:end]
-
-                # forward pass and loss computation
-                s_b = tf.gather(states, batch_indexes, axis=0)
-                a_b = tf.gather(actions, batch_indexes, axis=0)
-                d_b = tf.gather(delta, batch_indexes, axis=0)
-                with tf.GradientTape() as tape:
-                    policy_loss, critic_loss, entropy_loss = self._loss((s_b, a_b, tf.stop_gradient(d_b)))
-                    loss = policy_loss + critic_loss - entropy_loss
-                assert not tf.math.is_inf(loss) and not tf.math.is_nan(loss), f'{policy_loss, critic_loss, entropy_loss}'
-
-                # backward pass
-                grads = tape.gradient(loss, self._actor_critic.trainable_variables)
-                if self._gradient_clip_norm is not None:
-                    grads, norm = tf.clip_by_global_norm(grads, self._gradient_clip_norm)
-                self._opt.apply_gradients(list(zip(grads, self._actor_critic.trainable_variables)))
+        update_info = self._update_rounds(states, actions, tf.stop_gradient(delta), batch_size, update_rounds)
+        assert update_info['finite_losses'], 'inf or nan loss encountered during training'
 
         self.clear_memory()
-        return {'policy_loss': float(policy_loss),
-                'critic_loss': float(critic_loss),
-                'entropy_loss': float(entropy_loss)}
+        return {'policy_loss': float(update_info['policy_loss']),
+                'critic_loss': float(update_info['critic_loss']),
+                'entropy_loss': float(update_info['entropy_loss'])}
 
     def _networks_config_and_weights(self):
         net_config = self._actor_critic.get_config()
@@ -12,9 +12,11 @@ from pyagents.policies import Policy
 import pyagents.utils.json_utils as json_utils
 
 
+@tf.function
 def update_target(source_vars, target_vars, tau=1.0):
     # source_variables = self._online_q_network.variables
     # target_variables = self._target_q_network.variables
+    # traced once per pair of networks, so all assignments run as a single graph
     for (sv, tv) in zip(source_vars, target_vars):
         tv.assign((1 - tau) * tv + tau * sv)
 
@@ -28,6 +30,7 @@ class Agent(tf.Module, abc.ABC):
     """
 
     eps = 1e-8  # numerical stability
+    _gradient_clip_norm: Optional[float] = None  # global norm used by _apply_gradients, set by subclasses
 
     AGENT_FILE = 'agent'
 
@@ -130,12 +133,15 @@ class Agent(tf.Module, abc.ABC):
         self._normalizers[name] = {'mean': np.zeros(shape, dtype=np.float32), 'var': np.ones(shape, dtype=np.float32), 'count': 1e-4}
 
     def set_normalizer(self, name: str, mean: np.ndarray, var: np.ndarray, count: int):
-        self._normalizers[name] = {'mean': mean, 'var': var, 'count': count}
+        self._normalizers[name] = {'mean': np.array(mean, dtype=np.float32),
+                                   'var': np.array(var, dtype=np.float32),
+                                   'count': count}
 
     def get_normalizer(self, name: str, ret_std=True):
         if name in self._normalizers:
-            mean = self._normalizers[name]['mean']
-            var = self._normalizers[name]['var']
+            normalizer = self._normalizers[name]  # read once, as it may be replaced concurrently
+            mean = normalizer['mean']
+            var = normalizer['var']
             if ret_std:
                 return mean, np.maximum(np.sqrt(var), 1e-6)
             else:
@@ -152,23 +158,24 @@ class Agent(tf.Module, abc.ABC):
         Returns:
             np.array, normalized input according
         """
-        cur_mean = self._normalizers[name]['mean']
-        cur_var = self._normalizers[name]['var']
-        cur_count = self._normalizers[name]['count']
+        normalizer = self._normalizers[name]
+        cur_mean = normalizer['mean']
+        cur_var = normalizer['var']
+        cur_count = normalizer['count']
         x_mean = np.mean(x, axis=0)
         x_var = np.var(x, axis=0)
         x_count = x.shape[0]
 
         new_count = cur_count + x_count
         delta = x_mean - cur_mean
-        new_mean = cur_mean + delta * x_count / new_count
+        new_mean = (cur_mean + delta * x_count / new_count).astype(np.float32)
         m2_a, m2_b = cur_var * cur_count, x_var * x_count
         m2 = m2_a + m2_b + (delta ** 2) * cur_count * x_count / new_count
-        new_var = m2 / new_count
+        new_var = (m2 / new_count).astype(np.float32)
 
-        self._normalizers[name]['mean'] = new_mean
-        self._normalizers[name]['var'] = new_var
-        self._normalizers[name]['count'] = new_count
+        # the normalizer is replaced as a whole, so that concurrent readers (e.g. a prefetching thread)
+        # never see a partially updated mean and variance
+        self._normalizers[name] = {'mean': new_mean, 'var': new_var, 'count': new_count}
 
         return self.normalize(name, x)
 
@@ -208,6 +215,12 @@ class Agent(tf.Module, abc.ABC):
         if self._wandb_run is not None and env_config is not None:
             self._wandb_run.config.update(env_config)
 
+    def warmup(self):
+        """Traces the acting graph(s) of the policy, so that tracing happens before the training loop rather than
+        at its first step. Graphs are only traced, not executed, so neither normalizers nor policy state (e.g.
+        exploration noise and random generators) are affected."""
+        self._policy.warmup(training=self._training)
+
     def act(self, state: np.ndarray, mask: Optional[np.ndarray] = None, training: bool = True):
         """Returns the best action in the state according to current policy.
 
@@ -239,6 +252,23 @@ class Agent(tf.Module, abc.ABC):
             wandb.log(self._log_dict)
             self._log_dict = {}
 
+    def _apply_gradients(self, grads: list, opt: tf.keras.optimizers.Optimizer, variables: list) -> tf.Tensor:
+        """Applies (clipped) gradients and returns the norms of the unclipped gradients, followed by their
+        global norm when clipping. Meant to be called from training steps wrapped into a tf.function."""
+        grad_norms = [tf.norm(g) for g in grads]
+        if self._gradient_clip_norm is not None:
+            grads, norm = tf.clip_by_global_norm(grads, self._gradient_clip_norm)
+            grad_norms.append(norm)
+        opt.apply_gradients(list(zip(grads, variables)))
+        return tf.stack(grad_norms)
+
+    def _grads_log(self, prefix: str, net: tf.Module, grad_norms: tf.Tensor) -> dict:
+        """Names the gradient norms returned by _apply_gradients for net's variables, for logging."""
+        names = [f'{prefix}/{".".join(var.name.split("/")[1:])}' for var in net.trainable_variables]
+        if self._gradient_clip_norm is not None:
+            names.append(f'{prefix}/norm')
+        return dict(zip(names, grad_norms.numpy()))
+
     @abc.abstractmethod
     def _train(self, batch_size: int, update_rounds: int, *args, **kwargs) -> dict:
         """Performs training step.
@@ -285,6 +315,22 @@ class Agent(tf.Module, abc.ABC):
         """
         pass
 
+    def remember_batch(self,
+                       states: np.ndarray,
+                       actions: np.ndarray,
+                       rewards: np.ndarray,
+                       next_states: np.ndarray,
+                       dones: np.ndarray,
+                       logprobs: Optional[np.ndarray] = None) -> None:
+        """Stores a sequence of consecutive experiences (e.g. a whole rollout), with time steps along the first
+        dimension of each array.
+
+        By default, each step is stored with remember(); subclasses may override this method to store them at once.
+        """
+        for t in range(len(states)):
+            kwargs = {} if logprobs is None else {'logprob': logprobs[t]}
+            self.remember(states[t], actions[t], rewards[t], next_states[t], dones[t], **kwargs)
+
     def _wandb_define_metrics(self):
         """Defines WandB metrics.
 
@@ -3,13 +3,11 @@ import gin
 import numpy as np
 import tensorflow as tf
 import wandb
-from keras.losses import MeanSquaredError, Huber
 
 from pyagents.agents.dqn import DQNAgent
 from pyagents.memory import load_memories
 from pyagents.networks import C51QNetwork
 from pyagents.policies import QPolicy, EpsGreedyPolicy
-from copy import deepcopy
 
 
 @gin.configurable
@@ -40,6 +38,8 @@ class C51DQNAgent(DQNAgent):
                  training: bool = True,
                  save_dir: str = './output',
                  wandb_params: Optional[dict] = None,
+                 jit_compile: bool = True,
+                 prefetch: bool = False,
                  dtype='float32'):
         """Creates a C51 DQN agent. Number of atoms is taken from the network.
 
@@ -69,7 +69,15 @@ class C51DQNAgent(DQNAgent):
             gradient_clip_norm: (Optional) If provided, gradients are scaled so that
               the norm does not exceed this value. Defaults to 0.5.
             log_dict: (Optional) additional logger parameters.
+            jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
+            prefetch: (Optional) If True, minibatches are sampled from the buffer by a tf.data pipeline
+              in the background and prefetched. Defaults to False.
             """
+        assert isinstance(q_network, C51QNetwork), 'distributional dqn agent requires distributional q net'
+        # support must be set before networks are built (and copied) by the parent constructor
+        support_min = -v_max if v_min is None else v_min
+        support = tf.cast(tf.linspace(support_min, v_max, q_network.n_atoms), dtype)
+        q_network.set_support(support)
         super(C51DQNAgent, self).__init__(state_shape,
                                           action_shape,
                                           q_network=q_network,
@@ -87,13 +95,13 @@ class C51DQNAgent(DQNAgent):
                                           buffer=buffer,
                                           save_dir=save_dir,
                                           name=name,
+                                          jit_compile=jit_compile,
+                                          prefetch=prefetch,
                                           dtype=dtype)
         if optimizer is None and training:
             raise ValueError('agent cannot be trained without optimizer')
 
-        assert isinstance(q_network, C51QNetwork), 'distributional dqn agent requires distributional q net'
         self._online_q_network = q_network
-        self._target_q_network = deepcopy(self._online_q_network)
         self._target_update_period = target_update_period
         self._optimizer = optimizer
         self._train_step = 0
@@ -104,14 +112,10 @@ class C51DQNAgent(DQNAgent):
             'v_min': v_min,
             'v_max': v_max,
         })
-        if v_min is None:
-            v_min = -v_max
-        self._v_min = v_min
+        self._v_min = support_min
         self._v_max = v_max
-        self._support = tf.cast(tf.linspace(v_min, v_max, self._online_q_network.n_atoms), self.dtype)
-        self._delta_z = (v_max - v_min) / (self._online_q_network.n_atoms - 1)
-        self._online_q_network.set_support(self._support)
-        self._target_q_network.set_support(self._support)
+        self._support = support  # shared by online and target networks
+        self._delta_z = (v_max - support_min) / (self._online_q_network.n_atoms - 1)
 
         policy = QPolicy(self._state_shape, self._action_shape, self._online_q_network)
         if self._online_q_network.noisy_layers:
@@ -124,20 +128,16 @@ class C51DQNAgent(DQNAgent):
                               {**self.config,
                                **{f'q_net/{k}': v for k, v in self._online_q_network.get_config().items()},
                                **log_dict})
-        # build networks
-        self._online_q_network(tf.ones((1, *state_shape)))
-        self._target_q_network(tf.ones((1, *state_shape)))
 
     def _wandb_define_metrics(self):
         super()._wandb_define_metrics()
 
     def _loss(self, memories, weights=None):
         state_batch, action_batch, reward_batch, next_state_batch, done_batch = memories
-        # boolean mask to choose only performed actions, assumes 1d action space
-        mask = tf.one_hot(action_batch, self.action_shape, on_value=True, off_value=False)
 
         online_out = self._online_q_network(state_batch)
-        preds_qvals_logits = online_out.logits[mask]
+        # select only performed actions, assumes 1d action space (gather keeps shapes static, as required by XLA)
+        preds_qvals_logits = tf.gather(online_out.logits, action_batch, axis=1, batch_dims=1)
         target_out = self._target_q_network(next_state_batch)
         next_target_dist = target_out.dist_params
 
@@ -145,11 +145,11 @@ class C51DQNAgent(DQNAgent):
             # double q-learning: select actions using online network, and evaluate them using target network
             self._online_q_network.reset_noise()
             next_online_out = self._online_q_network(next_state_batch)
-            actions = tf.one_hot(next_online_out.actions, self.action_shape, on_value=True, off_value=False)
+            next_actions = next_online_out.actions
         else:
             # select actions from target network
-            actions = tf.one_hot(target_out.actions, self.action_shape, on_value=True, off_value=False)
-        next_target_dist = next_target_dist[actions]
+            next_actions = target_out.actions
+        next_target_dist = tf.gather(next_target_dist, next_actions, axis=1, batch_dims=1)
 
         proj_dist, targets = self._project_dist(next_target_dist, reward_batch, done_batch)
 
@@ -160,7 +160,7 @@ class C51DQNAgent(DQNAgent):
         loss = tf.reduce_mean(td_residuals)
 
         # logging
-        q_values = tf.stop_gradient(online_out.critic_values[mask])
+        q_values = tf.stop_gradient(tf.gather(online_out.critic_values, action_batch, axis=1, batch_dims=1))
         q_targets = tf.stop_gradient(tf.tensordot(proj_dist, self._support, 1))
         return {'loss': loss,
                 'td_residuals': td_residuals,
@@ -169,13 +169,10 @@ class C51DQNAgent(DQNAgent):
 
     def _project_dist(self, p_astar, rewards, dones):
         """Computes projection from transition. See Algorithm 1 in Bellemare et al., 2017"""
-        batch_size = rewards.shape[0]
         n_atoms = self._online_q_network.n_atoms
 
-        # needed for vectorization along batch dim
-        tiled_support = tf.reshape(tf.tile(self._support, (batch_size,)), (batch_size, n_atoms))
-        # compute projection
-        T_z = rewards + (1 - dones) * self._gamma * tiled_support
+        # compute projection, support is broadcast along batch dim
+        T_z = rewards + (1 - dones) * self._gamma * tf.expand_dims(self._support, 0)
         T_z = tf.clip_by_value(T_z, self._v_min, self._v_max)
 
         b = (T_z - self._v_min) / self._delta_z
@@ -183,29 +180,30 @@ class C51DQNAgent(DQNAgent):
         lb_term = p_astar * (u - b)
         ub_term = p_astar * (b - l)
 
-        m = tf.zeros((batch_size, n_atoms), dtype=self.dtype)
-        for j in tf.range(n_atoms):
-            update_idx = tf.where(tf.one_hot(tf.cast(l[:, j], tf.int32), n_atoms, on_value=True, off_value=False))
-            m = tf.tensor_scatter_nd_add(m, update_idx, lb_term[:, j])
-            update_idx = tf.where(tf.one_hot(tf.cast(u[:, j], tf.int32), n_atoms, on_value=True, off_value=False))
-            m = tf.tensor_scatter_nd_add(m, update_idx, ub_term[:, j])
+        # distribute probability mass of each atom j onto its neighbours l_j and u_j, for all atoms at once:
+        # m_k = sum_j lb_term_j * [l_j == k] + ub_term_j * [u_j == k]
+        l_one_hot = tf.one_hot(tf.cast(l, tf.int32), n_atoms, dtype=self.dtype)  # shape (batch, n_atoms, n_atoms)
+        u_one_hot = tf.one_hot(tf.cast(u, tf.int32), n_atoms, dtype=self.dtype)
+        m = tf.einsum('bj,bjk->bk', lb_term, l_one_hot) + tf.einsum('bj,bjk->bk', ub_term, u_one_hot)
 
         return m, T_z
 
     def _minibatch_to_tf(self, minibatch):
-        """ Given a list of experience tuples (s_t, a_t, r_t, s_t+1, done_t)
+        """ Given a tuple of arrays (states, actions, rewards, next_states, dones), one per experience field,
             returns list of 5 tensors batches """
-        states = np.array([sample[0].reshape(self.state_shape) for sample in minibatch])
-        next_states = np.array([sample[3].reshape(self.state_shape) for sample in minibatch])
+        states, actions, rewards, next_states, dones = minibatch
+        states = states.reshape((-1,) + self.state_shape)
+        next_states = next_states.reshape((-1,) + self.state_shape)
         if 'obs' in self.normalizers:
             states = self.normalize('obs', states)
             next_states = self.normalize('obs', next_states)
         states_batch = tf.convert_to_tensor(states, dtype=self.dtype)
         next_states_batch = tf.convert_to_tensor(next_states, dtype=self.dtype)
-        action_batch = tf.convert_to_tensor([sample[1] for sample in minibatch], dtype=tf.int32)
-        reward_batch = tf.convert_to_tensor([sample[2] for sample in minibatch], dtype=self.dtype)
+        action_batch = tf.convert_to_tensor(np.asarray(actions, dtype=np.int32))
+        reward_batch = tf.convert_to_tensor(np.asarray(rewards, dtype=self.dtype))
         reward_batch = tf.reshape(reward_batch, (-1, 1))
-        done_batch = np.array([sample[4] for sample in minibatch]).reshape((-1, 1))
+        done_batch = tf.convert_to_tensor(np.asarray(dones, dtype=self.dtype))
+        done_batch = tf.reshape(done_batch, (-1, 1))
         return [states_batch, action_batch, reward_batch, next_states_batch, done_batch]
 
     @staticmethod
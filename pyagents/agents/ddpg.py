@@ -1,4 +1,3 @@
-from copy import deepcopy
 from typing import Optional, List, Dict
 import gin
 import numpy as np
@@ -29,6 +28,7 @@ class DDPG(OffPolicyAgent):
                  stddev: float = 0.2,
                  standardize: bool = True,
                  gradient_clip_norm: Optional[float] = 0.5,
+                 jit_compile: bool = True,
                  training: bool = True,
                  log_dict: dict = None,
                  save_dir: str = './output',
@@ -48,6 +48,7 @@ class DDPG(OffPolicyAgent):
             gamma: (Optional) Discount factor. Defaults to 0.5.
             standardize: (Optional) If True, standardizes delta before computing gradient update. Defaults to True.
             gradient_clip_norm: (Optional) Global norm for gradient clipping, pass None to disable. Defaults to 0.5.
+            jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
             training: (Optional) If True, agent is in training phase. Defaults to True.
             log_dict: (Optional) Additional dict of config parameters that should be logged by WandB. Defaults to None.
             name: (Optional) Name of the agent.
@@ -64,7 +65,7 @@ class DDPG(OffPolicyAgent):
         if (actor_opt is None or critic_opt is None) and training:
             raise ValueError('agent cannot be trained without optimizers')
         self._ac = actor_critic
-        self._ac_target = deepcopy(self._ac)
+        self._ac_target = self._ac.copy()
         self._actor_opt = actor_opt
         self._critic_opt = critic_opt
 
@@ -79,12 +80,15 @@ class DDPG(OffPolicyAgent):
         self._tau = tau
         self._standardize = standardize
         self._gradient_clip_norm = gradient_clip_norm
+        # forward passes, losses, gradient steps and target update are traced once and fused into a single graph
+        self._update = tf.function(self._update, jit_compile=jit_compile)
 
         self.config.update({
             'gamma': self.gamma,
             'tau': self._tau,
             'standardize': self._standardize,
             'gradient_clip_norm': self._gradient_clip_norm,
+            'jit_compile': jit_compile
         })
 
         if wandb_params:
@@ -95,6 +99,7 @@ class DDPG(OffPolicyAgent):
                                **{f'actor_critic/{k}': v for k, v in self._ac.get_config().items()},
                                **log_dict})
         self._ac(tf.ones((1, *state_shape))), self._ac_target(tf.ones((1, *state_shape)))  # TODO remove
+        update_target(source_vars=self._ac.variables, target_vars=self._ac_target.variables)
 
     def _wandb_define_metrics(self):
         super()._wandb_define_metrics()
@@ -102,33 +107,32 @@ class DDPG(OffPolicyAgent):
         wandb.define_metric('critic_loss', step_metric="train_step", summary="min")
 
     def _minibatch_to_tf(self, minibatch):
-        """ Given a list of experience tuples (s_t, a_t, r_t, s_t+1, done_t)
+        """ Given a tuple of arrays (states, actions, rewards, next_states, dones), one per experience field,
             returns list of 5 tensors batches """
-        states = np.array([sample[0].reshape(self.state_shape) for sample in minibatch])
-        next_states = np.array([sample[3].reshape(self.state_shape) for sample in minibatch])
+        states, actions, rewards, next_states, dones = minibatch
+        states = states.reshape((-1,) + self.state_shape)
+        next_states = next_states.reshape((-1,) + self.state_shape)
         if 'obs' in self.normalizers:
             states = self.normalize('obs', states)
             next_states = self.normalize('obs', next_states)
         states_batch = tf.convert_to_tensor(states, dtype=self.dtype)
         next_states_batch = tf.convert_to_tensor(next_states, dtype=self.dtype)
-        action_batch = tf.convert_to_tensor([sample[1] for sample in minibatch], dtype=self.dtype)
-        reward_batch = tf.convert_to_tensor([sample[2] for sample in minibatch], dtype=tf.float32)
+        action_batch = tf.convert_to_tensor(np.asarray(actions, dtype=self.dtype))
+        reward_batch = tf.convert_to_tensor(np.asarray(rewards, dtype=self.dtype))
         reward_batch = tf.expand_dims(reward_batch, 1)  # shape must be (batch, 1)
-        done_batch = tf.cast(tf.convert_to_tensor([sample[4] for sample in minibatch]), self.dtype)
+        done_batch = tf.convert_to_tensor(np.asarray(dones, dtype=self.dtype))
         done_batch = tf.expand_dims(done_batch, 1)  # shape must be (batch, 1)
         return [states_batch, action_batch, reward_batch, next_states_batch, done_batch]
 
-    def _train(self, batch_size=128, *args, **kwargs):
-        self._memory.commit_ltmemory()
-        assert self._training, 'called train function but agent is in evaluation mode'
-        memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
-        states, actions, rewards, next_states, dones = memories  # (s, a, r, s', d)
-        assert rewards.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {rewards.shape}"
-        assert dones.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {dones.shape}"
+    def _update(self, states, actions, rewards, next_states, dones):
+        """Performs a single gradient step on both critic and actor, followed by a soft update of the target networks,
+        given a minibatch of memories.
 
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
         # Compute targets
         pi_target_out = self._ac_target.pi(next_states)
-        act = pi_target_out.action
+        act = pi_target_out.actions
         c_target_out = self._ac_target.critic((next_states, act))  # Q_targ(s', pi_targ(s'))
         q_preds = c_target_out.critic_values
         targets = rewards + self.gamma * (1 - dones) * q_preds
@@ -137,48 +141,53 @@ class DDPG(OffPolicyAgent):
         with tf.GradientTape(watch_accessed_variables=False) as q_tape:
             q_tape.watch(self._ac.critic.trainable_variables)
             q_values = self._ac.critic((states, actions)).critic_values
-            q_loss = (tf.stop_gradient(targets) - q_values) ** 2
-            q_loss = tf.reduce_mean(q_loss)
-        assert not tf.math.is_inf(q_loss) and not tf.math.is_nan(q_loss)
-        critic_grads = q_tape.gradient(q_loss, self._ac.critic.trainable_variables)
-        if self._gradient_clip_norm is not None:
-            critic_grads, critic_norm = tf.clip_by_global_norm(critic_grads, self._gradient_clip_norm)
-        critic_grads_and_vars = list(zip(critic_grads, self._ac.critic.trainable_variables))
-        self._critic_opt.apply_gradients(critic_grads_and_vars)
+            q_loss = tf.reduce_mean(tf.math.squared_difference(tf.stop_gradient(targets), q_values))
+        critic_vars = self._ac.critic.trainable_variables
+        critic_grad_norms = self._apply_gradients(q_tape.gradient(q_loss, critic_vars), self._critic_opt, critic_vars)
 
         # Gradient ascent step for policy
         with tf.GradientTape(watch_accessed_variables=False) as pi_tape:
             pi_tape.watch(self._ac.pi.trainable_variables)
-            pi_preds = self._ac.pi(states).action
+            pi_preds = self._ac.pi(states).actions
             pi_loss = - tf.reduce_mean(self._ac.critic((states, pi_preds)).critic_values)
-        assert not tf.math.is_inf(pi_loss) and not tf.math.is_nan(pi_loss)
-        pi_grads = pi_tape.gradient(pi_loss, self._ac.pi.trainable_variables)
-        if self._gradient_clip_norm is not None:
-            pi_grads, pi_norm = tf.clip_by_global_norm(pi_grads, self._gradient_clip_norm)
-        pi_grads_and_vars = list(zip(pi_grads, self._ac.pi.trainable_variables))
-        self._actor_opt.apply_gradients(pi_grads_and_vars)
+        pi_vars = self._ac.pi.trainable_variables
+        pi_grad_norms = self._apply_gradients(pi_tape.gradient(pi_loss, pi_vars), self._actor_opt, pi_vars)
 
         # Update target networks
         update_target(source_vars=self._ac.variables,
                       target_vars=self._ac_target.variables,
                       tau=self._tau)
+
+        return {'policy_loss': pi_loss,
+                'critic_loss': q_loss,
+                'q_values': q_values,
+                'targets': targets,
+                'actor_grad_norms': pi_grad_norms,
+                'critic_grad_norms': critic_grad_norms}
+
+    def _train(self, batch_size=128, *args, **kwargs):
+        assert self._training, 'called train function but agent is in evaluation mode'
+        memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
+        states, actions, rewards, next_states, dones = memories  # (s, a, r, s', d)
+        assert rewards.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {rewards.shape}"
+        assert dones.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {dones.shape}"
+
+        update_info = self._update(states, actions, rewards, next_states, dones)
+        pi_loss, q_loss = float(update_info['policy_loss']), float(update_info['critic_loss'])
+        assert np.isfinite(pi_loss) and np.isfinite(q_loss), 'inf or nan loss encountered during training'
         self._train_step += 1
 
         if self.is_logging:
             if self._log_gradients:
-                pi_grads_log = {f'actor/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                   for grad, var in pi_grads_and_vars}
-                critic_grads_log = {f'critic/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                    for grad, var in critic_grads_and_vars}
-                if self._gradient_clip_norm is not None:
-                    pi_grads_log['actor/norm'] = pi_norm
-                    critic_grads_log['critic/norm'] = critic_norm
-                self._log(do_log_step=False, prefix='gradients', **pi_grads_log, **critic_grads_log)
-            self._log(do_log_step=False, prefix='debug', state_values=q_values.numpy(), td_targets=targets.numpy())
-            self._log(do_log_step=True, policy_loss=float(pi_loss), critic_loss=float(q_loss),
+                grads_log = {**self._grads_log('actor', self._ac.pi, update_info['actor_grad_norms']),
+                             **self._grads_log('critic', self._ac.critic, update_info['critic_grad_norms'])}
+                self._log(do_log_step=False, prefix='gradients', **grads_log)
+            self._log(do_log_step=False, prefix='debug', state_values=update_info['q_values'].numpy(),
+                      td_targets=update_info['targets'].numpy())
+            self._log(do_log_step=True, policy_loss=pi_loss, critic_loss=q_loss,
                       train_step_pi=self._train_step, train_step_v=self._train_step)
 
-        return {'policy_loss': float(pi_loss), 'critic_loss': float(q_loss)}
+        return {'policy_loss': pi_loss, 'critic_loss': q_loss}
 
     def _networks_config_and_weights(self):
         return [('ac', self._ac.get_config(), self._ac.get_weights())]
@@ -1,4 +1,6 @@
+import atexit
 import os
+import weakref
 from math import log
 from typing import Optional, List, Dict
 import gin
@@ -7,14 +9,12 @@ import json
 import numpy as np
 import tensorflow as tf
 import wandb
-from keras.losses import MeanSquaredError, Huber
 
 from pyagents.agents.agent import update_target
 from pyagents.agents.off_policy_agent import OffPolicyAgent
 from pyagents.memory import Buffer, UniformBuffer, load_memories
 from pyagents.networks import DiscreteQNetwork
 from pyagents.policies import QPolicy, EpsGreedyPolicy, Policy
-from copy import deepcopy
 
 
 @gin.configurable
@@ -43,6 +43,8 @@ class DQNAgent(OffPolicyAgent):
                  training: bool = True,
                  save_dir: str = './output',
                  wandb_params: Optional[dict] = None,
+                 jit_compile: bool = True,
+                 prefetch: bool = False,
                  dtype: str = 'float32',
                  **kwargs):
         """Creates a DQN agent.
@@ -71,6 +73,10 @@ class DQNAgent(OffPolicyAgent):
             gradient_clip_norm: (Optional) If provided, gradients are scaled so that
               the norm does not exceed this value. Defaults to 0.5.
             log_dict: (Optional) additional logger parameters.
+            jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
+            prefetch: (Optional) If True, minibatches are sampled from the buffer by a tf.data pipeline
+              in the background and prefetched, overlapping sampling with training. Since the next minibatch
+              is sampled before priorities are updated, it may lag one training step behind. Defaults to False.
             """
         super(DQNAgent, self).__init__(state_shape,
                                        action_shape,
@@ -87,21 +93,37 @@ class DQNAgent(OffPolicyAgent):
         # assert isinstance(action_shape, int), 'current implementation only supports 1D discrete action spaces'
 
         self._online_q_network = q_network
-        self._target_q_network = deepcopy(self._online_q_network)
+        self._target_q_network = self._online_q_network.copy()
+        # build both networks and start from the same weights
+        self._online_q_network(tf.ones((1, *state_shape))), self._target_q_network(tf.ones((1, *state_shape)))
+        update_target(source_vars=self._online_q_network.variables,
+                      target_vars=self._target_q_network.variables)
         self._target_update_period = target_update_period
         self._tau = tau
         self._optimizer = optimizer
-        self._td_errors_loss_fn = MeanSquaredError(reduction='none') if loss_fn == 'mse' else Huber(reduction='none')
+        assert loss_fn in ('mse', 'huber'), f'unsupported loss function {loss_fn}'
+        self._loss_fn = loss_fn
         self._train_step = 0
         self._ddqn = ddqn
         self._gradient_clip_norm = gradient_clip_norm
         self._name = name
+        # forward pass, loss and gradient step are traced once and fused into a single graph
+        self._update = tf.function(self._update, jit_compile=jit_compile)
+        self._prefetch = prefetch
+        self._memories_iterator = None  # iterator over the prefetched minibatches, created on first train call
+        self._prefetch_batch_size = None  # batch size of the above iterator
+        if prefetch:
+            # the iterator must be released before interpreter teardown, or tf.data fails to finalize it
+            stop_prefetching = weakref.WeakMethod(self._stop_prefetching)
+            atexit.register(lambda: stop_prefetching() is not None and stop_prefetching()())
 
         self.config.update({
             'target_update_period': self._target_update_period,
             'tau': self._tau,
             'ddqn': self._ddqn,
-            'gradient_clip_norm': self._gradient_clip_norm
+            'gradient_clip_norm': self._gradient_clip_norm,
+            'jit_compile': jit_compile,
+            'prefetch': prefetch
         })
 
         if log_dict is None:
@@ -130,59 +152,75 @@ class DQNAgent(OffPolicyAgent):
 
     def _loss(self, memories, weights=None):
         state_batch, action_batch, reward_batch, next_state_batch, done_batch = memories
-        # boolean mask to choose only performed actions, assumes 1d action space
-        mask = tf.one_hot(action_batch, self.action_shape, on_value=True, off_value=False)
 
-        q_out = self._online_q_network(state_batch, training=True)
-        preds_q_values = q_out.critic_values[mask]
+        q_values = self._online_q_network(state_batch, training=True).critic_values
+        # select only performed actions, assumes 1d action space (gather keeps shapes static, as required by XLA)
+        preds_q_values = tf.gather(q_values, action_batch, axis=1, batch_dims=1)
         next_target_q_values = self._target_q_network(next_state_batch).critic_values
 
         if self._ddqn:
             # double q-learning: select actions using online network, and evaluate them using target network
+            # next states go through a separate inference pass, so that dropout does not perturb action selection
             next_online_q_values = self._online_q_network(next_state_batch).critic_values
-            actions = tf.one_hot(tf.math.argmax(next_online_q_values, axis=1),
-                                 self.action_shape, on_value=True, off_value=False)
-            bootstrap_values = next_target_q_values[actions]
+            actions = tf.math.argmax(next_online_q_values, axis=1)
+            bootstrap_values = tf.gather(next_target_q_values, actions, axis=1, batch_dims=1)
         else:
             # standard dqn target
             bootstrap_values = tf.math.reduce_max(next_target_q_values, axis=1)
-        bootstrap_rews = tf.stop_gradient(reward_batch + (1. - done_batch) * self._gamma_n * bootstrap_values)
-
-        target_q_values = tf.where(done_batch, reward_batch, bootstrap_rews)
-        # loss function reduces last axis, so we reshape to add a dummy one
-        td_residuals = self._td_errors_loss_fn(tf.expand_dims(preds_q_values, -1), tf.expand_dims(target_q_values, -1))
+        target_q_values = tf.stop_gradient(reward_batch + (1. - done_batch) * self._gamma_n * bootstrap_values)
+        td_errors = target_q_values - preds_q_values
+        if self._loss_fn == 'mse':
+            td_losses = tf.math.squared_difference(target_q_values, preds_q_values)
+        else:  # huber loss with delta = 1
+            abs_td_errors = tf.math.abs(td_errors)
+            td_losses = tf.where(abs_td_errors <= 1., 0.5 * tf.math.square(td_errors), abs_td_errors - 0.5)
         if weights is not None:  # weigh each sample by its weight before mean reduction
-            td_residuals = weights * td_residuals
-        loss = tf.reduce_mean(td_residuals)
+            td_losses = weights * td_losses
+        loss = tf.reduce_mean(td_losses)
         return {'loss': loss,
-                'td_residuals': td_residuals,
+                'td_residuals': tf.math.abs(td_errors),  # used as priorities by prioritized buffers
                 'q_values': preds_q_values,
                 'q_targets': target_q_values}
 
+    def _update(self, memories, weights):
+        """Performs a single gradient descent step on a minibatch of memories.
+
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
+        with tf.GradientTape() as tape:
+            loss_info = self._loss(memories, weights=weights)
+        variables_to_train = self._online_q_network.trainable_variables
+        grads = tape.gradient(loss_info['loss'], variables_to_train)
+        grad_norms = self._apply_gradients(grads, self._optimizer, variables_to_train)
+        return {**loss_info, 'grad_norms': grad_norms}
+
     def _train(self, batch_size=128, *args, **kwargs):
         assert self._training, 'called train function while in evaluation mode, call toggle_training() before'
-        memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
+        if self._prefetch:
+            if self._memories_iterator is None or self._prefetch_batch_size != batch_size:
+                self._memories_iterator = iter(self._prefetched_memories(batch_size))
+                self._prefetch_batch_size = batch_size
+            # the prefetched minibatch was sampled before the last update_samples() call, so with a prioritized
+            # buffer its indexes and importance sampling weights lag one training step behind
+            samples, indexes, is_weights = next(self._memories_iterator)
+            # samples are vectorized here rather than in the pipeline, as normalization reads agent statistics
+            memories = self._minibatch_to_tf(tuple(t.numpy() for t in samples))
+            indexes, is_weights = indexes.numpy(), is_weights.numpy()
+        else:
+            memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
         # resets noisy layers noise parameters (if used)
         if self._online_q_network.noisy_layers:
             self._online_q_network.reset_noise()
             self._target_q_network.reset_noise()
 
-        # compute loss
-        with tf.GradientTape() as tape:
-            loss_info = self._loss(memories, weights=tf.constant(is_weights, dtype=self.dtype))
-            loss = loss_info['loss']
+        # forward pass, loss computation and backward pass
+        loss_info = self._update(memories, tf.constant(is_weights, dtype=self.dtype))
+        loss = loss_info['loss']
         # use computed loss to update memories priorities (when using a prioritized buffer)
-        self._memory.update_samples(tf.math.abs(loss_info['td_residuals']), indexes)
-        # backward pass
-        variables_to_train = self._online_q_network.trainable_weights
-        grads = tape.gradient(loss, variables_to_train)
-        if self._gradient_clip_norm is not None:
-            grads, norm = tf.clip_by_global_norm(grads, self._gradient_clip_norm)
-        grads_and_vars = list(zip(grads, variables_to_train))
-        self._optimizer.apply_gradients(grads_and_vars)
+        self._memory.update_samples(loss_info['td_residuals'], indexes)
 
         # periodically update target network
-        if tf.math.mod(self._train_step, self._target_update_period) == 0:
+        if self._train_step % self._target_update_period == 0:
             update_target(source_vars=self._online_q_network.variables,
                           target_vars=self._target_q_network.variables,
                           tau=self._tau)
@@ -197,11 +235,8 @@ class DQNAgent(OffPolicyAgent):
         # logging
         if self.is_logging:
             if self._log_gradients:
-                grads_log = {f'{".".join(var.name.split("/")[1:])}': grad.numpy()
-                             for grad, var in grads_and_vars}
-                if self._gradient_clip_norm is not None:
-                    grads_log['critic/norm'] = norm
-                self._log(do_log_step=False, prefix='gradients', **grads_log)
+                self._log(do_log_step=False, prefix='gradients',
+                          **self._grads_log('critic', self._online_q_network, loss_info['grad_norms']))
             values_log = loss_info['q_values'].numpy()
             targets_log = loss_info['q_targets'].numpy()
             self._log(do_log_step=False, prefix='debug',
@@ -214,19 +249,55 @@ class DQNAgent(OffPolicyAgent):
 
         return {'loss': float(loss)}
 
+    def _stop_prefetching(self):
+        """Releases the prefetching iterator (if any), which stops the background sampling from the buffer."""
+        if self._memories_iterator is not None:
+            # deleted before being reset, as otherwise tf.Module would keep tracking (and referencing) it
+            del self._memories_iterator
+        self._memories_iterator = None
+        self._prefetch_batch_size = None
+
+    def toggle_training(self, training: Optional[bool] = None) -> None:
+        self._stop_prefetching()
+        super().toggle_training(training)
+
+    def save(self, ver):
+        self._stop_prefetching()  # memories must not be sampled while being saved
+        super().save(ver)
+
+    def _prefetched_memories(self, batch_size):
+        """Returns a tf.data pipeline that keeps sampling raw minibatches from the buffer in the background."""
+        def sample():
+            while True:
+                (states, actions, rewards, next_states, dones), indexes, is_weights = self._memory.sample(batch_size)
+                samples = (np.asarray(states, dtype=np.float32),
+                           np.asarray(actions, dtype=np.int64).reshape(-1),
+                           np.asarray(rewards, dtype=np.float32).reshape(-1),
+                           np.asarray(next_states, dtype=np.float32),
+                           np.asarray(dones, dtype=np.float32).reshape(-1))
+                yield samples, np.asarray(indexes, dtype=np.int64), np.asarray(is_weights, dtype=np.float32)
+
+        states_spec = tf.TensorSpec((batch_size,) + self.state_shape, dtype=tf.float32)
+        fields_spec = tf.TensorSpec((batch_size,), dtype=tf.float32)
+        signature = ((states_spec, tf.TensorSpec((batch_size,), dtype=tf.int64), fields_spec, states_spec, fields_spec),
+                     tf.TensorSpec((None,), dtype=tf.int64),  # empty for uniform buffers
+                     fields_spec)
+        return tf.data.Dataset.from_generator(sample, output_signature=signature).prefetch(1)
+
     def _minibatch_to_tf(self, minibatch):
-        """ Given a list of experience tuples (s_t, a_t, r_t, s_t+1, done_t)
+        """ Given a tuple of arrays (states, actions, rewards, next_states, dones), one per experience field,
             returns list of 5 tensors batches """
-        states = np.array([sample[0].reshape(self.state_shape) for sample in minibatch])
-        next_states = np.array([sample[3].reshape(self.state_shape) for sample in minibatch])
+        states, actions, rewards, next_states, dones = minibatch
+        states = states.reshape((-1,) + self.state_shape)
+        next_states = next_states.reshape((-1,) + self.state_shape)
         if 'obs' in self.normalizers:
             states = self.normalize('obs', states)
             next_states = self.normalize('obs', next_states)
         states_batch = tf.convert_to_tensor(states, dtype=self.dtype)
         next_states_batch = tf.convert_to_tensor(next_states, dtype=self.dtype)
-        action_batch = tf.convert_to_tensor([sample[1] for sample in minibatch], dtype=tf.int32)
-        reward_batch = tf.convert_to_tensor([sample[2] for sample in minibatch], dtype=self.dtype)
-        done_batch = np.array([sample[4] for sample in minibatch])
+        action_batch = tf.convert_to_tensor(np.asarray(actions, dtype=np.int32))
+        reward_batch = tf.convert_to_tensor(np.asarray(rewards, dtype=self.dtype))
+        done_batch = tf.convert_to_tensor(np.asarray(dones, dtype=self.dtype))
         return [states_batch, action_batch, reward_batch, next_states_batch, done_batch]
 
     def _networks_config_and_weights(self):
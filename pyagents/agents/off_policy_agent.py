@@ -62,7 +62,7 @@ class OffPolicyAgent(Agent, ABC):
         s_t, _ = envs.reset()
         for _ in range(min_memories // self.num_envs):
             if actions is not None:
-                a_t = np.random.choice(actions, 1)
+                a_t = np.random.choice(actions, self.num_envs)  # one random action for each env
             else:
                 a_t = envs.action_space.sample()
             s_tp1, r_t, terminated, truncated, info = envs.step(a_t)
@@ -75,9 +75,21 @@ class OffPolicyAgent(Agent, ABC):
         reward = reward * self.reward_scaling
         self._memory.commit_stmemory((state, action, reward, next_state, done), gamma=self._gamma)
 
+    def remember_batch(self, states, actions, rewards, next_states, dones, logprobs=None) -> None:
+        rewards = rewards * self.reward_scaling
+        if self._memory.n_step_return == 1:
+            # without multi-step returns, the steps of all envs are independent and committed as a single batch
+            fragment = tuple(np.reshape(x, (-1,) + np.shape(x)[2:])
+                             for x in (states, actions, rewards, next_states, dones))
+            self._memory.commit_stmemory(fragment, gamma=self._gamma)
+        else:  # multi-step returns are computed over consecutive steps
+            for t in range(len(states)):
+                self._memory.commit_stmemory((states[t], actions[t], rewards[t], next_states[t], dones[t]),
+                                             gamma=self._gamma)
+
     @abc.abstractmethod
     def _minibatch_to_tf(self, minibatch):
-        """ Given a list of experience tuples (s_t, a_t, r_t, s_t+1, done_t)
+        """ Given a tuple of arrays (states, actions, rewards, next_states, dones), one per experience field,
             returns list of 5 tensors batches """
         pass
 
@@ -42,25 +42,29 @@ class OnPolicyAgent(Agent, ABC):
         return True
 
     def init(self, envs, rollout_steps, env_config=None, *args, **kwargs):
-        """Initializes memory (i.e. trajectories storage)."""
+        """Initializes memory (i.e. trajectories storage).
+
+        Memory is preallocated once with the network dtype, so that each step is written in place and the whole
+        rollout can be converted to tensors without copies or casts.
+        """
         super().init(envs, env_config=env_config, *args, **kwargs)
         assert isinstance(envs, gym.vector.VectorEnv), 'envs must be instance of VectorEnv even for a single instance'
         if isinstance(envs.single_action_space, gym.spaces.Discrete):
-            self._memory['actions'] = np.zeros((rollout_steps, envs.num_envs))
+            self._memory['actions'] = np.zeros((rollout_steps, envs.num_envs), dtype=self.dtype)
         elif isinstance(envs.single_action_space, gym.spaces.Box):
-            self._memory['actions'] = np.zeros((rollout_steps, envs.num_envs) + self.action_shape)
+            self._memory['actions'] = np.zeros((rollout_steps, envs.num_envs) + self.action_shape, dtype=self.dtype)
         else:
             raise NotImplementedError(f'unsupported action space {envs.single_action_space}')
 
-        self._memory['states'] = np.zeros((rollout_steps, envs.num_envs) + self.state_shape)
-        self._memory['next_states'] = np.zeros((rollout_steps, envs.num_envs) + self.state_shape)
-        self._memory['rewards'] = np.zeros((rollout_steps, envs.num_envs))
-        self._memory['dones'] = np.zeros((rollout_steps, envs.num_envs))
-        self._memory['logprobs'] = np.zeros((rollout_steps, envs.num_envs))
+        self._memory['states'] = np.zeros((rollout_steps, envs.num_envs) + self.state_shape, dtype=self.dtype)
+        self._memory['next_states'] = np.zeros((rollout_steps, envs.num_envs) + self.state_shape, dtype=self.dtype)
+        self._memory['rewards'] = np.zeros((rollout_steps, envs.num_envs), dtype=self.dtype)
+        self._memory['dones'] = np.zeros((rollout_steps, envs.num_envs), dtype=self.dtype)
+        self._memory['logprobs'] = np.zeros((rollout_steps, envs.num_envs), dtype=self.dtype)
         self._rollout_size = rollout_steps * envs.num_envs
 
     def clear_memory(self):
-        self._memory = {k: np.zeros_like(self._memory[k]) for k in self.MEMORY_KEYS}
+        # memory is reused across rollouts, as each rollout overwrites all of its steps
         self._step = 0
 
     def remember(self,
@@ -91,18 +95,37 @@ class OnPolicyAgent(Agent, ABC):
         self._memory['logprobs'][self._step] = logprob
         self._step += 1
 
+    def remember_batch(self, states, actions, rewards, next_states, dones, logprobs=None) -> None:
+        # the whole sequence is written at once in the preallocated memory
+        steps = slice(self._step, self._step + len(states))
+        self._memory['states'][steps] = states
+        self._memory['actions'][steps] = actions
+        self._memory['rewards'][steps] = rewards
+        self._memory['next_states'][steps] = next_states
+        self._memory['dones'][steps] = dones
+        self._memory['logprobs'][steps] = 0.0 if logprobs is None else logprobs
+        self._step += len(states)
+
     def compute_returns(self):
         """Computes empirical returns of current trajectory"""
-        rewards = self._memory['rewards'].reshape(-1)
-        dones = 1 - self._memory['dones'].reshape(-1)
-        returns = np.empty_like(rewards)
-        returns[-1] = rewards[-1]
-        for i, r in enumerate(rewards[-2::-1]):
-            t = len(rewards) - i - 2
-            returns[t] = r + (self.gamma * dones[t] * returns[t + 1])
-        returns = tf.convert_to_tensor(returns, dtype=tf.float32)
+        rewards = tf.convert_to_tensor(self._memory['rewards'], dtype=tf.float32)
+        dones = tf.convert_to_tensor(1 - self._memory['dones'], dtype=tf.float32)
+        returns = self._discounted_returns(rewards, dones)
         return tf.reshape(returns, (-1, 1))
 
+    @tf.function
+    def _discounted_returns(self, rewards, dones):
+        """Backward accumulation of discounted rewards along the time axis, for all envs at once.
+
+        Args:
+            rewards: tensor of shape (rollout_steps, num_envs).
+            dones: tensor of shape (rollout_steps, num_envs), 0 where the episode ends and 1 otherwise.
+        """
+        return tf.scan(lambda ret_tp1, x: x[0] + self.gamma * x[1] * ret_tp1,
+                       (rewards, dones),
+                       initializer=tf.zeros_like(rewards[0]),
+                       reverse=True)
+
     def compute_gae(self, state_values, next_state_values):
         """Computes Generalized Advantage Estimation of current trajectory.
 
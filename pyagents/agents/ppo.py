@@ -31,6 +31,7 @@ class PPO(OnPolicyAgent):
                  critic_value_coef: float = 0.5,
                  entropy_coef: float = 0,
                  gradient_clip_norm: Optional[float] = 0.5,
+                 jit_compile: bool = True,
                  training: bool = True,
                  save_dir: str = './output',
                  log_dict: dict = None,
@@ -59,6 +60,7 @@ class PPO(OnPolicyAgent):
                     entropy_coef: (Optional) Coefficient applied to entropy loss. Defaults to 1e-3.
                     gradient_clip_norm: (Optional) Global norm for gradient clipping, pass None to disable.
                       Defaults to 0.5.
+                    jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
                     training: (Optional) If True, agent is in training phase. Defaults to True.
                     log_dict: (Optional) Additional dict of config parameters that should be logged by WandB.
                       Defaults to None.
@@ -88,6 +90,8 @@ class PPO(OnPolicyAgent):
         self._gradient_clip_norm = gradient_clip_norm
         self._clip_eps = clip_eps
         self._target_kl = target_kl
+        # forward pass, loss and gradient steps are traced once into a single graph
+        self._update = tf.function(self._update, jit_compile=jit_compile)
         if returns_normalization:
             self.init_normalizer('returns', (1,))
 
@@ -99,7 +103,8 @@ class PPO(OnPolicyAgent):
             'clip_eps': self._clip_eps,
             'standardize': self._standardize,
             'critic_value_coef': self._critic_value_coef,
-            'entropy_coef': self._entropy_coef
+            'entropy_coef': self._entropy_coef,
+            'jit_compile': jit_compile
         })
 
         if wandb_params:
@@ -147,17 +152,17 @@ class PPO(OnPolicyAgent):
     def _loss_pi(self, states, actions, adv, logprobs):
         pi_out = self._pi(inputs=states)
         dist_params = pi_out.dist_params
-        new_logprobs = tf.reshape(self.get_policy().log_prob(dist_params, actions), (-1, 1))
+        new_logprobs = tf.reshape(self._policy.log_prob(dist_params, actions), (-1, 1))
         pi_logratio = new_logprobs - logprobs
         pi_ratio = tf.exp(pi_logratio)
         pi_clipped = tf.clip_by_value(pi_ratio, 1 - self._clip_eps, 1 + self._clip_eps)
         policy_loss = -tf.reduce_mean(tf.minimum(pi_ratio * adv, pi_clipped * adv))
 
-        entropy_loss = self._entropy_coef * tf.reduce_mean(self.get_policy().entropy(dist_params))
+        entropy_loss = self._entropy_coef * tf.reduce_mean(self._policy.entropy(dist_params))
 
         # kl divergence for early stopping condition http://joschu.net/blog/kl-approx.html and clipfrac debug variable
         approx_kl = tf.reduce_mean((pi_ratio - 1) - pi_logratio)
-        clipfrac = 1 - (tf.math.count_nonzero(tf.abs((pi_ratio - 1)) < self._clip_eps) / pi_ratio.shape[0])
+        clipfrac = tf.reduce_mean(tf.cast(tf.abs((pi_ratio - 1)) >= self._clip_eps, pi_ratio.dtype))
 
         return policy_loss, entropy_loss, (tf.stop_gradient(approx_kl), tf.stop_gradient(clipfrac))
 
@@ -166,6 +171,34 @@ class PPO(OnPolicyAgent):
         critic_loss = self._critic_value_coef * tf.reduce_mean((critic_values - returns) ** 2)
         return critic_loss
 
+    def _update(self, states, actions, adv, logprobs, returns):
+        """Performs a single gradient step on the critic and, while the approximate KL divergence stays below
+        target, on the actor, given a minibatch of the current trajectory.
+
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
+        actor_vars = self._pi.trainable_variables
+        critic_vars = self._vf.trainable_variables
+        with tf.GradientTape(persistent=True) as tape:
+            loss_info = self._loss(states=states, actions=actions, returns=returns, adv=adv, logprobs=logprobs)
+        loss = loss_info['loss']
+
+        def skip_actor():
+            n_norms = len(actor_vars) + (self._gradient_clip_norm is not None)
+            return tf.zeros((n_norms,))
+
+        update_actor = loss_info['approx_kl'] <= self._target_kl
+        actor_grad_norms = tf.cond(update_actor,
+                                   lambda: self._apply_gradients(tape.gradient(loss, actor_vars),
+                                                                 self._actor_opt, actor_vars),
+                                   skip_actor)
+        critic_grad_norms = self._apply_gradients(tape.gradient(loss, critic_vars), self._critic_opt, critic_vars)
+        del tape
+        return {**loss_info,
+                'update_actor': update_actor,
+                'actor_grad_norms': actor_grad_norms,
+                'critic_grad_norms': critic_grad_norms}
+
     def _train(self, batch_size, update_rounds, *args, **kwargs):
         # trackers for losses
         pi_losses, v_losses, e_losses = [], [], []
@@ -215,52 +248,29 @@ class PPO(OnPolicyAgent):
                 if self._standardize:
                     mb_adv = ((mb_adv - tf.math.reduce_mean(mb_adv)) / (tf.math.reduce_std(mb_adv) + self.eps))
 
-                # training: forward and loss computation
-                with tf.GradientTape(persistent=True) as tape:
-                    loss_info = self._loss(states=mb_states,
-                                           actions=mb_actions,
-                                           returns=tf.stop_gradient(mb_returns),
-                                           adv=tf.stop_gradient(mb_adv),
-                                           logprobs=mb_logprobs)
+                # training: forward, loss computation and backward pass
+                loss_info = self._update(mb_states, mb_actions, tf.stop_gradient(mb_adv), mb_logprobs,
+                                         tf.stop_gradient(mb_returns))
                 loss = loss_info['loss']
                 assert not tf.math.is_inf(loss) and not tf.math.is_nan(loss)
 
-                # training: backward pass
-                if loss_info['approx_kl'] <= self._target_kl:  # can still update policy network
-                    actor_grads = tape.gradient(loss, self._pi.trainable_variables)
-                    if self._gradient_clip_norm is not None:
-                        actor_grads, actor_norm = tf.clip_by_global_norm(actor_grads, self._gradient_clip_norm)
-                    actor_grads_and_vars = list(zip(actor_grads, self._pi.trainable_variables))
-                    self._actor_opt.apply_gradients(actor_grads_and_vars)
+                if loss_info['update_actor']:  # policy network has been updated
                     self._train_step_pi += 1
                     if self.is_logging:
                         if self._log_gradients:
-                            actor_grads_log = {f'actor/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                               for grad, var in actor_grads_and_vars}
-                            if self._gradient_clip_norm is not None:
-                                actor_grads_log['actor/norm'] = actor_norm
-                            self._log(do_log_step=False, prefix='gradients', **actor_grads_log)
+                            self._log(do_log_step=False, prefix='gradients',
+                                      **self._grads_log('actor', self._pi, loss_info['actor_grad_norms']))
                         self._log(do_log_step=False, prefix='debug',
                                   approx_kl=loss_info['approx_kl'], clipfrac=loss_info['clipfrac'])
                         self._log(do_log_step=True, policy_loss=loss_info['policy_loss'],
                                   entropy_loss=loss_info['entropy_loss'], train_step_pi=self._train_step_pi)
-
-                critic_grads = tape.gradient(loss, self._vf.trainable_variables)
-                if self._gradient_clip_norm is not None:
-                    critic_grads, critic_norm = tf.clip_by_global_norm(critic_grads, self._gradient_clip_norm)
-                critic_grads_and_vars = list(zip(critic_grads, self._vf.trainable_variables))
-                self._critic_opt.apply_gradients(critic_grads_and_vars)
-                del tape
                 self._train_step_v += 1
 
                 # logging
                 if self.is_logging:
                     if self._log_gradients:
-                        critic_grads_log = {f'critic/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                            for grad, var in critic_grads_and_vars}
-                        if self._gradient_clip_norm is not None:
-                            critic_grads_log['critic/norm'] = critic_norm
-                        self._log(do_log_step=False, prefix='gradients', **critic_grads_log)
+                        self._log(do_log_step=False, prefix='gradients',
+                                  **self._grads_log('critic', self._vf, loss_info['critic_grad_norms']))
                     values_log = tf.gather(state_values, batch_indexes, axis=0).numpy()
                     targets_log = tf.gather(unnormalized_returns, batch_indexes, axis=0).numpy()
                     self._log(do_log_step=False, prefix='debug',
@@ -6,7 +6,6 @@ import tensorflow as tf
 from pyagents.agents.dqn import DQNAgent
 from pyagents.networks import QRQNetwork
 from pyagents.policies import QPolicy, EpsGreedyPolicy
-from copy import deepcopy
 
 
 @gin.configurable
@@ -36,6 +35,8 @@ class QRDQNAgent(DQNAgent):
                  training: bool = True,
                  save_dir: str = './output',
                  wandb_params: Optional[dict] = None,
+                 jit_compile: bool = True,
+                 prefetch: bool = False,
                  dtype='float32'):
         """Creates a QR-DQN agent. Number of quantiles is taken from the network.
 
@@ -63,6 +64,9 @@ class QRDQNAgent(DQNAgent):
             gradient_clip_norm: (Optional) If provided, gradients are scaled so that
               the norm does not exceed this value. Defaults to 0.5.
             log_dict: (Optional) additional logger parameters.
+            jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
+            prefetch: (Optional) If True, minibatches are sampled from the buffer by a tf.data pipeline
+              in the background and prefetched. Defaults to False.
             """
         super(QRDQNAgent, self).__init__(state_shape,
                                          action_shape,
@@ -81,13 +85,14 @@ class QRDQNAgent(DQNAgent):
                                          buffer=buffer,
                                          save_dir=save_dir,
                                          name=name,
+                                         jit_compile=jit_compile,
+                                         prefetch=prefetch,
                                          dtype=dtype)
         if optimizer is None and training:
             raise ValueError('agent cannot be trained without optimizer')
 
         assert isinstance(q_network, QRQNetwork), 'distributional dqn agent requires distributional q net'
         self._online_q_network = q_network
-        self._target_q_network = deepcopy(self._online_q_network)
         self._target_update_period = target_update_period
         self._optimizer = optimizer
         self._train_step = 0
@@ -118,22 +123,21 @@ class QRDQNAgent(DQNAgent):
 
     def _loss(self, memories, weights=None):
         state_batch, action_batch, reward_batch, next_state_batch, done_batch = memories
-        # boolean mask to choose only performed actions, assumes 1d action space
-        mask = tf.one_hot(action_batch, self.action_shape, on_value=True, off_value=False)
 
         online_out = self._online_q_network(state_batch)
-        current_quantiles = online_out.dist_params[mask]
+        # select only performed actions, assumes 1d action space (gather keeps shapes static, as required by XLA)
+        current_quantiles = tf.gather(online_out.dist_params, action_batch, axis=1, batch_dims=1)
         target_out = self._target_q_network(next_state_batch)
 
         if self._ddqn:
             # double q-learning: select actions using online network, and evaluate them using target network
             self._online_q_network.reset_noise()
             next_online_out = self._online_q_network(next_state_batch)
-            actions = tf.one_hot(next_online_out.actions, self.action_shape, on_value=True, off_value=False)
+            next_actions = next_online_out.actions
         else:
             # select actions from target network
-            actions = tf.one_hot(target_out.actions, self.action_shape, on_value=True, off_value=False)
-        next_quantiles = target_out.dist_params[actions]
+            next_actions = target_out.actions
+        next_quantiles = tf.gather(target_out.dist_params, next_actions, axis=1, batch_dims=1)
 
         target_quantiles = reward_batch + (1. - done_batch) * self._gamma_n * tf.stop_gradient(next_quantiles)
         # compute td errors for each pair of (theta_i(x), theta_j(x')) quantiles
@@ -156,7 +160,7 @@ class QRDQNAgent(DQNAgent):
         loss = tf.reduce_mean(td_residuals)
 
         # logging
-        q_values = tf.stop_gradient(online_out.critic_values[mask])
+        q_values = tf.stop_gradient(tf.gather(online_out.critic_values, action_batch, axis=1, batch_dims=1))
         q_targets = tf.stop_gradient(tf.reduce_mean(target_quantiles, axis=1)[:, 0])
         return {'loss': loss,
                 'td_residuals': td_residuals,
@@ -164,19 +168,20 @@ class QRDQNAgent(DQNAgent):
                 'q_targets': q_targets}
 
     def _minibatch_to_tf(self, minibatch):
-        """ Given a list of experience tuples (s_t, a_t, r_t, s_t+1, done_t)
+        """ Given a tuple of arrays (states, actions, rewards, next_states, dones), one per experience field,
             returns list of 5 tensors batches """
-        states = np.array([sample[0].reshape(self.state_shape) for sample in minibatch])
-        next_states = np.array([sample[3].reshape(self.state_shape) for sample in minibatch])
+        states, actions, rewards, next_states, dones = minibatch
+        states = states.reshape((-1,) + self.state_shape)
+        next_states = next_states.reshape((-1,) + self.state_shape)
         if 'obs' in self.normalizers:
             states = self.normalize('obs', states)
             next_states = self.normalize('obs', next_states)
         states_batch = tf.convert_to_tensor(states, dtype=self.dtype)
         next_states_batch = tf.convert_to_tensor(next_states, dtype=self.dtype)
-        action_batch = tf.convert_to_tensor([sample[1] for sample in minibatch], dtype=tf.int32)
-        reward_batch = tf.convert_to_tensor([sample[2] for sample in minibatch], dtype=self.dtype)
+        action_batch = tf.convert_to_tensor(np.asarray(actions, dtype=np.int32))
+        reward_batch = tf.convert_to_tensor(np.asarray(rewards, dtype=self.dtype))
         reward_batch = tf.reshape(reward_batch, (-1, 1))
-        done_batch = tf.convert_to_tensor([1. if sample[4] else 0. for sample in minibatch], dtype=self.dtype)
+        done_batch = tf.convert_to_tensor(np.asarray(dones, dtype=self.dtype))
         done_batch = tf.reshape(done_batch, (-1, 1))
         return [states_batch, action_batch, reward_batch, next_states_batch, done_batch]
 
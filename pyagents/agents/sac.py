@@ -1,4 +1,3 @@
-from copy import deepcopy
 from typing import Optional, Dict, List
 import gin
 import numpy as np
@@ -40,6 +39,7 @@ class SAC(OffPolicyAgent):
                  target_entropy: Optional[float] = None,
                  gradient_clip_norm: Optional[float] = 0.5,
                  normalize_obs: bool = True,
+                 jit_compile: bool = True,
                  training: bool = True,
                  log_dict: dict = None,
                  name: str = 'SAC',
@@ -59,11 +59,11 @@ class SAC(OffPolicyAgent):
 
         self._actor = actor
         self._online_critic1 = critic
-        self._target_critic1 = deepcopy(self._online_critic1)
+        self._target_critic1 = self._online_critic1.copy()
         self._online_critic2 = critic2
         if self._online_critic2 is None:
-            self._online_critic2 = deepcopy(self._online_critic1)
-        self._target_critic2 = deepcopy(self._online_critic2)
+            self._online_critic2 = self._online_critic1.copy()
+        self._target_critic2 = self._online_critic2.copy()
         self._actor_opt = actor_opt
         self._critic1_opt = critic1_opt
         self._critic2_opt = critic2_opt
@@ -88,6 +88,8 @@ class SAC(OffPolicyAgent):
         if reward_normalization:
             self.init_normalizer('reward', (1,))
         self.reward_scale = reward_scaling
+        # forward passes, losses and gradient steps are traced once into a single graph
+        self._update = tf.function(self._update, jit_compile=jit_compile)
         self.config.update({'gamma': self.gamma,
                             'tau': self.tau,
                             'target_update_period': self.target_update_period,
@@ -97,7 +99,8 @@ class SAC(OffPolicyAgent):
                             'target_entropy': self.target_entropy,
                             'initial_alpha': self._initial_alpha,
                             'train_alpha': train_alpha,
-                            'reward_scaling': reward_scaling})
+                            'reward_scaling': reward_scaling,
+                            'jit_compile': jit_compile})
 
         if wandb_params:
             self._init_logger(wandb_params,
@@ -114,6 +117,8 @@ class SAC(OffPolicyAgent):
         self._target_critic1((ones, a))
         self._online_critic2((ones, a))
         self._target_critic2((ones, a))
+        for o, t in zip([self._online_critic1, self._online_critic2], [self._target_critic1, self._target_critic2]):
+            update_target(source_vars=o.variables, target_vars=t.variables)
 
     @property
     def alpha(self):
@@ -125,6 +130,11 @@ class SAC(OffPolicyAgent):
             self.update_normalizer('reward', reward)
         super().remember(state, action, reward, next_state, done, *args, **kwargs)
 
+    def remember_batch(self, states, actions, rewards, next_states, dones, logprobs=None) -> None:
+        if 'reward' in self.normalizers:
+            self.update_normalizer('reward', np.reshape(rewards, -1))
+        super().remember_batch(states, actions, rewards, next_states, dones, logprobs)
+
     def _wandb_define_metrics(self):
         super()._wandb_define_metrics()
         wandb.define_metric('policy_loss', step_metric="train_step", summary="min")
@@ -134,20 +144,21 @@ class SAC(OffPolicyAgent):
         wandb.define_metric('alpha_loss', step_metric="train_step", summary="min")
 
     def _minibatch_to_tf(self, minibatch):
-        states = np.array([sample[0].reshape(self.state_shape) for sample in minibatch])
-        next_states = np.array([sample[3].reshape(self.state_shape) for sample in minibatch])
+        states, actions, rewards, next_states, dones = minibatch
+        states = states.reshape((-1,) + self.state_shape)
+        next_states = next_states.reshape((-1,) + self.state_shape)
         if 'obs' in self.normalizers:
             states = self.normalize('obs', states)
             next_states = self.normalize('obs', next_states)
         states_batch = tf.convert_to_tensor(states, dtype=self.dtype)
         next_states_batch = tf.convert_to_tensor(next_states, dtype=self.dtype)
-        action_batch = tf.convert_to_tensor([sample[1] for sample in minibatch], dtype=self.dtype)
-        reward_batch = tf.convert_to_tensor([sample[2] for sample in minibatch], dtype=self.dtype)
+        action_batch = tf.convert_to_tensor(np.asarray(actions, dtype=self.dtype))
+        reward_batch = tf.convert_to_tensor(np.asarray(rewards, dtype=self.dtype))
         if 'reward' in self.normalizers:
             _, std_r = self.get_normalizer('reward')
             reward_batch /= std_r
         reward_batch = tf.expand_dims(reward_batch, 1)  # shape must be (batch, 1)
-        done_batch = tf.cast(tf.convert_to_tensor([sample[4] for sample in minibatch]), self.dtype)
+        done_batch = tf.convert_to_tensor(np.asarray(dones, dtype=self.dtype))
         done_batch = tf.expand_dims(done_batch, 1)  # shape must be (batch, 1)
         return [states_batch, action_batch, reward_batch, next_states_batch, done_batch]
 
@@ -173,14 +184,12 @@ class SAC(OffPolicyAgent):
         act_loss = tf.reduce_mean(self.alpha * tf.expand_dims(logprobs, 1) - q)
         return {'act_loss': act_loss, 'logprobs': logprobs}
 
-    def _train(self, batch_size: int, update_rounds: int, *args, **kwargs) -> dict:
-        assert self._training, 'called train function while in evaluation mode, call toggle_training() before'
-        assert len(self._memory) > batch_size, f'batch size bigger than amount of memories'
-        memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
-        states, actions, rewards, next_states, dones = memories  # (s, a, r, s', d)
-        assert rewards.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {rewards.shape}"
-        assert dones.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {dones.shape}"
+    def _update(self, states, actions, rewards, next_states, dones, is_weights):
+        """Performs a single gradient step on both critics, on the actor and (optionally) on the temperature,
+        given a minibatch of memories.
 
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
         # compute targets
         act_out = self._actor(next_states)
         next_action = act_out.actions
@@ -189,11 +198,32 @@ class SAC(OffPolicyAgent):
         targets = self.reward_scale * rewards + self.gamma * (1 - dones) * (
                 tf.minimum(q1_target, q2_target) - self.alpha * tf.expand_dims(act_out.logprobs, 1))
 
-        critic_loss_info = self._train_critics(actions, indexes, is_weights, states, targets)
+        critic_loss_info = self._train_critics(actions, states, tf.stop_gradient(targets))
+        pi_loss_info = self._train_actor(states)
+        alpha_loss_info = self._train_alpha(pi_loss_info)
+
+        # use computed loss to update memories priorities (when using a prioritized buffer) TODO verify
+        critic_td_loss = 0.5 * is_weights * tf.squeeze(
+            critic_loss_info['critic1_td_loss'] + critic_loss_info['critic2_td_loss'])
+        losses = tf.stack([critic_loss_info['critic1_loss'], critic_loss_info['critic2_loss'],
+                           pi_loss_info['act_loss'], alpha_loss_info['alpha_loss']])
+        return {**critic_loss_info, **pi_loss_info, **alpha_loss_info,
+                'td_residuals': tf.math.abs(tf.squeeze(critic_td_loss)),
+                'targets': targets,
+                'finite_losses': tf.reduce_all(tf.math.is_finite(losses))}
 
-        actor_grads_and_vars, actor_norm, pi_loss_info = self._train_actor(states)
+    def _train(self, batch_size: int, update_rounds: int, *args, **kwargs) -> dict:
+        assert self._training, 'called train function while in evaluation mode, call toggle_training() before'
+        assert len(self._memory) > batch_size, f'batch size bigger than amount of memories'
+        memories, indexes, is_weights = self._memory.sample(batch_size, vectorizing_fn=self._minibatch_to_tf)
+        states, actions, rewards, next_states, dones = memories  # (s, a, r, s', d)
+        assert rewards.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {rewards.shape}"
+        assert dones.shape == (batch_size, 1), f"expected rewards with shape (batch, 1), received: {dones.shape}"
 
-        alpha_grads_log, alpha_loss = self._train_alpha(pi_loss_info)
+        update_info = self._update(states, actions, rewards, next_states, dones,
+                                   tf.convert_to_tensor(is_weights, dtype=self.dtype))
+        assert update_info['finite_losses'], 'inf or nan loss encountered during training'
+        self._memory.update_samples(update_info['td_residuals'], indexes)
 
         if self._train_step % self.target_update_period == 0:
             for o, t in zip([self._online_critic1, self._online_critic2], [self._target_critic1, self._target_critic2]):
@@ -202,32 +232,29 @@ class SAC(OffPolicyAgent):
                               tau=self.tau)
         self._train_step += 1
 
-        loss_dict = {'policy_loss': float(pi_loss_info['act_loss']),
-                     'critic_loss': float(tf.reduce_mean([critic_loss_info['critic1_loss'],
-                                                          critic_loss_info['critic2_loss']])),
-                     'critic1_loss': float(critic_loss_info['critic1_loss']),
-                     'critic2_loss': float(critic_loss_info['critic2_loss'])}
+        loss_dict = {'policy_loss': float(update_info['act_loss']),
+                     'critic_loss': float(tf.reduce_mean([update_info['critic1_loss'],
+                                                          update_info['critic2_loss']])),
+                     'critic1_loss': float(update_info['critic1_loss']),
+                     'critic2_loss': float(update_info['critic2_loss'])}
 
         if self.train_alpha:
-            loss_dict['alpha_loss'] = float(alpha_loss)
+            loss_dict['alpha_loss'] = float(update_info['alpha_loss'])
         if self.is_logging:
             if self._log_gradients:
-                pi_grads_log = {f'actor/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                for grad, var in actor_grads_and_vars}
-                critic1_grads_log = {f'critic1/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                     for grad, var in critic_loss_info[f'critic1_grad_vars']}
-                critic2_grads_log = {f'critic2/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                     for grad, var in critic_loss_info[f'critic2_grad_vars']}
-                if self._gradient_clip_norm is not None:
-                    pi_grads_log['actor/norm'] = actor_norm
-                    critic1_grads_log['critic1/norm'] = critic_loss_info[f'critic1_norm']
-                    critic1_grads_log['critic2/norm'] = critic_loss_info[f'critic2_norm']
-                self._log(do_log_step=False, prefix='gradients', **pi_grads_log, **critic1_grads_log,
-                          **critic2_grads_log, **alpha_grads_log)
-
-            state_values = tf.minimum(critic_loss_info['q1'], critic_loss_info['q2']).numpy()
-            self._log(do_log_step=False, prefix='debug', state_values=state_values, td_targets=targets.numpy(),
-                      alpha=float(self.alpha))
+                grads_log = {**self._grads_log('actor', self._actor, update_info['actor_grad_norms']),
+                             **self._grads_log('critic1', self._online_critic1, update_info['critic1_grad_norms']),
+                             **self._grads_log('critic2', self._online_critic2, update_info['critic2_grad_norms'])}
+                if self.train_alpha:
+                    alpha_norms = update_info['alpha_grad_norms'].numpy()
+                    grads_log[f'alpha/{".".join(self._log_alpha.name.split("/"))}'] = alpha_norms[0]
+                    if self._gradient_clip_norm is not None:
+                        grads_log['alpha/norm'] = alpha_norms[-1]
+                self._log(do_log_step=False, prefix='gradients', **grads_log)
+
+            state_values = tf.minimum(update_info['q1'], update_info['q2']).numpy()
+            self._log(do_log_step=False, prefix='debug', state_values=state_values,
+                      td_targets=update_info['targets'].numpy(), alpha=float(self.alpha))
             self._log(do_log_step=True, **loss_dict, train_step=self._train_step)
         return loss_dict
 
@@ -238,15 +265,11 @@ class SAC(OffPolicyAgent):
                 alpha_tape.watch([self._log_alpha])
                 alpha_loss = tf.reduce_mean(
                     - tf.exp(self._log_alpha) * (tf.stop_gradient(logprobs + self.target_entropy)))
-            alpha_grads_and_vars, alpha_norm = self._apply_gradients(alpha_loss, self._alpha_opt,
-                                                                     [self._log_alpha], alpha_tape)
-            alpha_grads_log = {f'alpha/{".".join(var.name.split("/"))}': grad.numpy()
-                               for grad, var in alpha_grads_and_vars}
-            alpha_grads_log['alpha/norm'] = alpha_norm
+            alpha_grad_norms = self._apply_gradients(alpha_tape.gradient(alpha_loss, [self._log_alpha]),
+                                                     self._alpha_opt, [self._log_alpha])
+            return {'alpha_loss': alpha_loss, 'alpha_grad_norms': alpha_grad_norms}
         else:
-            alpha_grads_log = dict()
-            alpha_loss = 0.
-        return alpha_grads_log, alpha_loss
+            return {'alpha_loss': tf.constant(0.)}
 
     def _train_actor(self, states):
         actor_vars = self._actor.trainable_variables
@@ -254,41 +277,26 @@ class SAC(OffPolicyAgent):
             pi_tape.watch(actor_vars)
             pi_loss_info = self._loss_pi(states)
             act_loss = pi_loss_info['act_loss']
-        actor_grads_and_vars, actor_norm = self._apply_gradients(act_loss, self._actor_opt, actor_vars, pi_tape)
-        return actor_grads_and_vars, actor_norm, pi_loss_info
+        actor_grad_norms = self._apply_gradients(pi_tape.gradient(act_loss, actor_vars), self._actor_opt, actor_vars)
+        return {**pi_loss_info, 'actor_grad_norms': actor_grad_norms}
 
-    def _train_critics(self, actions, indexes, is_weights, states, targets):
+    def _train_critics(self, actions, states, targets):
         log = dict()
         for i, (q, q_opt) in enumerate(zip([self._online_critic1, self._online_critic2],
                                            [self._critic1_opt, self._critic2_opt])):
             critic_vars = q.trainable_variables
             with tf.GradientTape(watch_accessed_variables=False) as q_tape:
                 q_tape.watch(critic_vars)
-                info = self._loss_q(q, states, actions, tf.stop_gradient(targets))
+                info = self._loss_q(q, states, actions, targets)
                 critic_loss = info['critic_loss']
 
-            critic_grads_and_vars, critic_norm = self._apply_gradients(critic_loss, q_opt, critic_vars, q_tape)
+            grad_norms = self._apply_gradients(q_tape.gradient(critic_loss, critic_vars), q_opt, critic_vars)
+            log[f'critic{i + 1}_grad_norms'] = grad_norms
             log[f'critic{i + 1}_loss'] = critic_loss
             log[f'critic{i + 1}_td_loss'] = info['critic_td_loss']
             log[f'q{i + 1}'] = info['q']
-            log[f'critic{i + 1}_grad_vars'] = critic_grads_and_vars
-            log[f'critic{i + 1}_norm'] = critic_norm
-        # use computed loss to update memories priorities (when using a prioritized buffer) TODO verify
-        critic_td_loss = 0.5 * is_weights * tf.squeeze(
-            log['critic1_td_loss'] + log['critic2_td_loss'])
-        self._memory.update_samples(tf.math.abs(tf.squeeze(critic_td_loss)), indexes)
         return log
 
-    def _apply_gradients(self, loss, opt, vars, tape):
-        assert not tf.math.is_inf(loss) and not tf.math.is_nan(loss)
-        grads = tape.gradient(loss, vars)
-        norm = None
-        if self._gradient_clip_norm is not None:
-            grads, norm = tf.clip_by_global_norm(grads, self._gradient_clip_norm)
-        critic_grads_and_vars = list(zip(grads, vars))
-        opt.apply_gradients(critic_grads_and_vars)
-        return critic_grads_and_vars, norm
-
     def _networks_config_and_weights(self):
         return [('actor', self._actor.get_config(), self._actor.get_weights()),
                 ('critic1', self._online_critic1.get_config(), self._online_critic1.get_weights()),
@@ -34,6 +34,7 @@ class VPG(OnPolicyAgent):
                  log_dict: dict = None,
                  name: str = 'VPG',
                  wandb_params: Optional[dict] = None,
+                 jit_compile: bool = True,
                  dtype: str = 'float32'):
         """Creates a VPG agent.
 
@@ -60,6 +61,7 @@ class VPG(OnPolicyAgent):
                       Defaults to None.
                     name: (Optional) Name of the agent.
                     wandb_params: (Optional) Dict of parameters to enable WandB logging. Defaults to None.
+                    jit_compile: (Optional) If True, the training step is compiled with XLA. Defaults to True.
                 """
         super(VPG, self).__init__(state_shape, action_shape, lam_gae=lam_gae,
                                   training=training, save_dir=save_dir, name=name,
@@ -85,23 +87,29 @@ class VPG(OnPolicyAgent):
         self._entropy_coef = entropy_coef
         self._standardize = standardize
         self._gradient_clip_norm = gradient_clip_norm
+        # forward pass, loss and gradient step are traced once and fused into a single graph
+        self._update = tf.function(self._update, jit_compile=jit_compile)
 
         self.config.update({
             'gamma': self.gamma,
             'standardize': self._standardize,
             'critic_value_coef': self._critic_value_coef,
-            'entropy_coef': self._entropy_coef
+            'entropy_coef': self._entropy_coef,
+            'jit_compile': jit_compile
         })
 
         if wandb_params:
             if log_dict is None:
                 log_dict = {}
+            baseline_config = self._baseline.get_config() if self._baseline is not None else {}
             self._init_logger(wandb_params,
                               {**self.config,
                                **{f'actor/{k}': v for k, v in self._actor.get_config().items()},
-                               **{f'baseline/{k}': v for k, v in self._baseline.get_config().items()},
+                               **{f'baseline/{k}': v for k, v in baseline_config.items()},
                                **log_dict})
-        self._actor(tf.ones((1, *state_shape))), self._baseline(tf.ones((1, *state_shape)))  # TODO remove
+        self._actor(tf.ones((1, *state_shape)))  # TODO remove
+        if self._baseline is not None:
+            self._baseline(tf.ones((1, *state_shape)))
 
     def _wandb_define_metrics(self):
         super()._wandb_define_metrics()
@@ -112,7 +120,7 @@ class VPG(OnPolicyAgent):
     def _loss(self, memories):
         states, actions, returns, delta = memories
         dist_params = self._actor(inputs=states).dist_params
-        log_prob = self.get_policy().log_prob(dist_params, actions)
+        log_prob = self._policy.log_prob(dist_params, actions)
         log_prob = tf.reshape(log_prob, (-1, 1))
         if self._baseline is not None:
             critic_values = self._baseline(states).critic_values
@@ -121,9 +129,35 @@ class VPG(OnPolicyAgent):
         else:
             policy_loss = -tf.reduce_mean((log_prob * returns))
             critic_loss = 0
-        entropy_loss = self._entropy_coef * tf.reduce_mean(self.get_policy().entropy(dist_params))
+        entropy_loss = self._entropy_coef * tf.reduce_mean(self._policy.entropy(dist_params))
         return policy_loss, critic_loss, entropy_loss
 
+    def _update(self, states, actions, returns, delta):
+        """Performs a single gradient step on both actor and critic, given a minibatch of the current trajectory.
+
+        This method is wrapped into a tf.function at construction time, so it must only operate on tensors.
+        """
+        actor_vars = self._actor.trainable_variables
+        critic_vars = self._baseline.trainable_variables if self._baseline is not None else []
+        with tf.GradientTape() as tape:
+            policy_loss, critic_loss, entropy_loss = self._loss((states, actions, returns, delta))
+            loss = policy_loss + critic_loss - entropy_loss
+
+        # single backward pass over both networks, then split gradients back per network
+        grads = tape.gradient(loss, actor_vars + critic_vars)
+        actor_grads, critic_grads = grads[:len(actor_vars)], grads[len(actor_vars):]
+        actor_grad_norms = self._apply_gradients(actor_grads, self._actor_opt, actor_vars)
+        if self._baseline is not None:
+            critic_grad_norms = self._apply_gradients(critic_grads, self._critic_opt, critic_vars)
+        else:
+            critic_grad_norms = tf.zeros((0,))
+        return {'loss': loss,
+                'policy_loss': policy_loss,
+                'critic_loss': critic_loss,
+                'entropy_loss': entropy_loss,
+                'actor_grad_norms': actor_grad_norms,
+                'critic_grad_norms': critic_grad_norms}
+
     def _train(self, batch_size, update_rounds, *args, **kwargs):
         # convert inputs to tf tensors and compute delta
         states = self.normalize('obs', np.reshape(self._memory['states'], (self._rollout_size, -1)))
@@ -132,24 +166,30 @@ class VPG(OnPolicyAgent):
         actions = tf.reshape(actions, (self._rollout_size, -1))
 
         returns = self.compute_returns()
-        state_values = self._baseline(states).critic_values
-
-        if self._lam_gae > 0:
+        if self._baseline is None:  # returns directly weight the log probs
+            delta = returns
+        elif self._lam_gae > 0:
+            state_values = self._baseline(states).critic_values
             next_states = self.normalize('obs', np.reshape(self._memory['next_states'], (self._rollout_size, -1)))
             next_states = tf.convert_to_tensor(next_states, dtype=self.dtype)
             next_state_values = self._baseline(next_states).critic_values
             _, delta = self.compute_gae(state_values=state_values, next_state_values=next_state_values)
         else:
+            state_values = self._baseline(states).critic_values
             delta = returns - tf.stop_gradient(state_values)
 
         if self._standardize:
-            returns = ((returns - tf.math.reduce_mean(returns)) / (tf.math.reduce_std(returns) + self.eps))
-            delta = ((delta - tf.math.reduce_mean(delta)) / (tf.math.reduce_std(delta) + self.eps))
+            # only standardize what multiplies the log probs: with a critic, returns are its (raw) targets
+            if self._baseline is None:
+                returns = ((returns - tf.math.reduce_mean(returns)) / (tf.math.reduce_std(returns) + self.eps))
+            else:
+                delta = ((delta - tf.math.reduce_mean(delta)) / (tf.math.reduce_std(delta) + self.eps))
 
         delta = tf.reshape(delta, (self._rollout_size, 1))
         returns = tf.reshape(returns, (self._rollout_size, 1))
 
         indexes = np.arange(states.shape[0])
+        finite_losses = tf.constant(True)  # checked once after all updates, to avoid a device sync at every step
         for _ in range(update_rounds):
             np.random.shuffle(indexes)
             # training: iterate minibatches
@@ -161,45 +201,30 @@ class VPG(OnPolicyAgent):
                 mb_delta = tf.gather(delta, batch_indexes, axis=0)
                 mb_returns = tf.gather(returns, batch_indexes, axis=0)
 
-                # training: forward and loss computation
-                with tf.GradientTape(persistent=True) as tape:
-                    policy_loss, critic_loss, entropy_loss = self._loss((mb_states,
-                                                                         mb_actions,
-                                                                         tf.stop_gradient(mb_returns),
-                                                                         tf.stop_gradient(mb_delta)))
-                    loss = policy_loss + critic_loss - entropy_loss
-                assert not tf.math.is_inf(loss) and not tf.math.is_nan(loss)
-
-                # training: backward pass
-                actor_grads = tape.gradient(loss, self._actor.trainable_variables)
-                critic_grads = tape.gradient(loss, self._baseline.trainable_variables)
-                if self._gradient_clip_norm is not None:
-                    actor_grads, actor_norm = tf.clip_by_global_norm(actor_grads, self._gradient_clip_norm)
-                    critic_grads, critic_norm = tf.clip_by_global_norm(critic_grads, self._gradient_clip_norm)
-                actor_grads_and_vars = list(zip(actor_grads, self._actor.trainable_variables))
-                critic_grads_and_vars = list(zip(critic_grads, self._baseline.trainable_variables))
-                self._actor_opt.apply_gradients(actor_grads_and_vars)
-                self._critic_opt.apply_gradients(critic_grads_and_vars)
-                del tape
+                # training: forward, loss computation and backward pass
+                update_info = self._update(mb_states, mb_actions,
+                                           tf.stop_gradient(mb_returns), tf.stop_gradient(mb_delta))
+                policy_loss = update_info['policy_loss']
+                critic_loss = update_info['critic_loss']
+                entropy_loss = update_info['entropy_loss']
+                finite_losses = tf.logical_and(finite_losses, tf.math.is_finite(update_info['loss']))
                 self._train_step += 1
 
                 # logging
                 if self.is_logging:
                     if self._log_gradients:
-                        actor_grads_log = {f'actor/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                           for grad, var in actor_grads_and_vars}
-                        critic_grads_log = {f'critic/{".".join(var.name.split("/")[1:])}': grad.numpy()
-                                            for grad, var in critic_grads_and_vars}
-                        if self._gradient_clip_norm is not None:
-                            actor_grads_log['actor/norm'] = actor_norm
-                            critic_grads_log['critic/norm'] = critic_norm
-                        self._log(do_log_step=False, prefix='gradients', **actor_grads_log, **critic_grads_log)
+                        grads_log = self._grads_log('actor', self._actor, update_info['actor_grad_norms'])
+                        if self._baseline is not None:
+                            grads_log.update(self._grads_log('critic', self._baseline,
+                                                             update_info['critic_grad_norms']))
+                        self._log(do_log_step=False, prefix='gradients', **grads_log)
                     losses_log = {'policy_loss': float(policy_loss),
                                   'critic_loss': float(critic_loss),
                                   'entropy_loss': float(entropy_loss),
                                   'train_step': self._train_step}
                     self._log(do_log_step=True, **losses_log)
 
+        assert finite_losses, 'inf or nan loss encountered during training'
         self.clear_memory()
 
         return {'policy_loss': float(policy_loss),
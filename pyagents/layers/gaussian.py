@@ -38,7 +38,7 @@ class GaussianLayer(tf.keras.layers.Layer):
             mean = self._act_means + self._act_magnitudes * mean
             std_dev = tf.math.softplus(self._std_dev) + self._std_eps
 
-        gaussian = tfp.distributions.MultivariateNormalDiag(loc=tf.zeros(mean.shape), scale_diag=tf.ones(std_dev.shape))
+        gaussian = tfp.distributions.MultivariateNormalDiag(loc=tf.zeros_like(mean), scale_diag=tf.ones_like(std_dev))
 
         if not training or self._deterministic:
             action = tfp.bijectors.Tanh()(mean)
@@ -44,6 +44,10 @@ class NoisyLayer(tf.keras.layers.Layer):
             initializer=tf.keras.initializers.RandomUniform(-b_range, b_range),
             trainable=True
         )
+        # noise is kept in variables, so that resetting it is also visible to traced functions; they are
+        # set bypassing keras tracking, so that they are not weights (i.e. not saved nor synced to target networks)
+        object.__setattr__(self, 'eps_w', tf.Variable(tf.zeros((in_dim, self.units)), trainable=False))
+        object.__setattr__(self, 'eps_b', tf.Variable(tf.zeros((self.units,)), trainable=False))
         self.reset_noise()
 
     def reset_noise(self, stddev=0.5):
@@ -53,8 +57,8 @@ class NoisyLayer(tf.keras.layers.Layer):
         eps_out = tf.random.normal((self.units,), stddev=stddev)
         eps_in = scale(eps_in)
         eps_out = scale(eps_out)
-        self.eps_w = tf.tensordot(eps_in, eps_out, axes=0)  # outer product to get (in_shape, units) matrix
-        self.eps_b = eps_out
+        self.eps_w.assign(tf.tensordot(eps_in, eps_out, axes=0))  # outer product to get (in_shape, units) matrix
+        self.eps_b.assign(eps_out)
 
     def call(self, x, training=True):
         rank = x.shape.rank
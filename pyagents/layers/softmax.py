@@ -1,5 +1,4 @@
 import tensorflow as tf
-import tensorflow_probability as tfp
 
 
 class SoftmaxLayer(tf.keras.layers.Layer):
@@ -12,10 +11,9 @@ class SoftmaxLayer(tf.keras.layers.Layer):
 
     def call(self, x, training=True):
         preferences = self._preferences(x)  # logits
-        dist = tfp.distributions.Categorical(logits=preferences)
         if training:  # TODO maybe not ok for all algos see ddpg
-            action = dist.sample()
+            action = tf.squeeze(tf.random.categorical(preferences, 1), axis=1)
         else:
             action = tf.math.argmax(preferences, axis=1)
-        logprobs = dist.log_prob(action)
+        logprobs = tf.gather(tf.nn.log_softmax(preferences), action, axis=1, batch_dims=1)
         return action, preferences, logprobs
@@ -1,5 +1,6 @@
 import os
 import pickle
+import threading
 import gin
 from abc import ABC, abstractmethod
 
@@ -21,6 +22,16 @@ class Buffer(ABC):
         if save_dir is not None and not os.path.isdir(save_dir):
             os.makedirs(save_dir)
         self._save_dir = save_dir
+        self._lock = threading.RLock()  # guards memories when sampled from a background thread (e.g. tf.data)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']  # locks cannot be pickled
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
 
     @abstractmethod
     def __len__(self):
@@ -40,7 +51,8 @@ class Buffer(ABC):
     def save(self):
         if self._save_dir is None:
             raise ValueError('Buffer needs a save_dir path')
-        pickle.dump(self, open(os.path.join(self._save_dir, 'memories.pkl'), 'wb'))
+        with self._lock, open(os.path.join(self._save_dir, 'memories.pkl'), 'wb') as f:
+            pickle.dump(self, f)
 
     def update_samples(self, errors, indexes):
         """ subclasses may optionally implement this method"""
@@ -14,12 +14,12 @@ class PrioritizedBuffer(UniformBuffer):
                  n_step_return=1,
                  eps=0.02,
                  alpha=0.5,
-                 beta=(0.4, 1.0, 10 ** 6)):
-        super().__init__(save_dir=save_dir, n_step_return=n_step_return)
-        self._sum_tree = SumTree(size)
-        self._size = size
-        self._ltmemory = dict()
-        self._ptr = 0
+                 beta=(0.4, 1.0, 10 ** 6),
+                 state_dtype='float32',
+                 seed=None):
+        super().__init__(save_dir=save_dir, size=size, n_step_return=n_step_return, state_dtype=state_dtype,
+                         seed=seed)
+        self._sum_tree = SumTree(size, rng=self._rng)
         self._eps = eps
         self._alpha = alpha
         if isinstance(beta, float):
@@ -34,36 +34,36 @@ class PrioritizedBuffer(UniformBuffer):
         self._config.update({'type': 'PER', 'eps_buffer': eps, 'alpha': alpha,
                              'beta': self._beta, 'beta_max': self._beta_max, 'beta_inc': self._beta_inc})
 
-    def __len__(self):
-        return len(self._sum_tree)
-
     def get_config(self):
         return self._config
 
-    def commit_ltmemory(self, experience):
-        self._ltmemory[self._ptr] = experience
-        self._sum_tree.set(self._ptr)  # mark as new experience in sum tree
-        self._ptr = (self._ptr + 1) % self._size
+    def commit_ltmemory_batch(self, experiences):
+        with self._lock:
+            indexes = self._store(experiences)
+            self._sum_tree.set_batch(indexes)  # mark as new experiences in sum tree
 
     def clear_stmemory(self):
         self.stmemory.clear()
 
     def sample(self, batch_size, vectorizing_fn=lambda x: x):
         bounds = np.linspace(0., 1., batch_size + 1)
-        indexes = [self._sum_tree.sample(lb=bounds[i], ub=bounds[i + 1]) for i in range(batch_size)]
-        priorities = np.array([self._sum_tree.get(idx) for idx in indexes])
-        samples = [tuple(self._ltmemory[idx].values()) for idx in indexes]
-        if self._beta != 0:
+        with self._lock:
+            indexes = self._sum_tree.sample_batch(lb=bounds[:-1], ub=bounds[1:])
+            priorities = self._sum_tree.get_batch(indexes)
+            samples = self._gather(indexes)
+            n_memories = self._len
+            beta = self._beta
+            self._beta = min(self._beta + self._beta_inc, self._beta_max)
+        if beta != 0:
             priorities_pow = np.power(priorities, self._alpha)
             probs = priorities_pow / priorities_pow.sum()
-            is_weights = np.power(1 / (len(self._sum_tree) * probs), self._beta)
+            is_weights = np.power(1 / (n_memories * probs), beta)
             is_weights = is_weights / np.max(is_weights)
         else:
-            is_weights = np.ones_like(indexes)
-        self._beta = min(self._beta + self._beta_inc, self._beta_max)
+            is_weights = np.ones(batch_size)
         return vectorizing_fn(samples), indexes, is_weights
 
     def update_samples(self, errors, indexes):
         assert len(errors.shape) == 1 and errors.shape[0] == len(indexes)
-        for error_idx, mem_idx in enumerate(indexes):
-            self._sum_tree.set(mem_idx, errors[error_idx].numpy() + self._eps)
+        with self._lock:
+            self._sum_tree.set_batch(np.asarray(indexes), np.asarray(errors) + self._eps)
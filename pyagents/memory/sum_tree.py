@@ -4,44 +4,61 @@ import numpy as np
 class SumTree:
     """A sum tree used for efficiently storing and sampling prioritized memories.
        A sum tree is a complete binary tree where leaves contain priorities and inner nodes
-       contain the sum of their subtrees."""
+       contain the sum of their subtrees.
+       Nodes are stored in a single flat array in heap order: children of node i are 2i + 1 and 2i + 2,
+       and leaves occupy the last n_leaves positions."""
 
-    def __init__(self, size: int):
+    def __init__(self, size: int, rng: np.random.Generator = None):
         """Creates the sum tree data structure.
 
         Args:
             size: total number of nodes maintaned in the tree.
+            rng: (Optional) random generator used for sampling. Defaults to a new generator seeded from the global
+              numpy random state.
         """
 
         assert isinstance(size, int) and size >= 0, f'wrong sum tree size {size}'
-        self._nodes = []
-        tree_depth = int(np.ceil(np.log2(size))) + 1
-        for nodes_depth_d in (2 ** d for d in range(tree_depth)):  # level at depth d contains 2 ** d nodes
-            self._nodes.append(np.zeros(nodes_depth_d))
+        self._depth = int(np.ceil(np.log2(size)))  # number of levels below the root
+        self._n_leaves = 2 ** self._depth
+        self._leaves_offset = self._n_leaves - 1  # position of the first leaf in the flat array
+        self._nodes = np.zeros(2 * self._n_leaves - 1)
         self._max_p = 1.0
+        self._rng = np.random.default_rng(np.random.randint(2 ** 31)) if rng is None else rng
 
     def __len__(self):
-        return np.sum(self._nodes[-1] != 0.)
+        return np.count_nonzero(self._nodes[self._leaves_offset:])
 
     def total_priority(self):
-        return self._nodes[0][0]
+        return self._nodes[0]
 
     def sample(self, lb=0.0, ub=1.0):
         """Samples a node from the sum tree."""
-        value = np.random.uniform(lb, ub) * self._nodes[0][0]  # sample a random number in (lb, ub]
-        idx = 0
-        for nodes_depth_d in self._nodes[1:]:
-            left = idx * 2  # index of left child
-            if value < nodes_depth_d[left]:  # recurse into left subtree
-                idx = left
-            else:
-                idx = left + 1  # recurse into right subtree
-                value -= nodes_depth_d[left]  # update value to match new subtree range
-        return idx
+        return int(self.sample_batch(np.array([lb]), np.array([ub]))[0])
+
+    def sample_batch(self, lb: np.ndarray, ub: np.ndarray) -> np.ndarray:
+        """Samples a batch of nodes from the sum tree, one from each (lb, ub] interval.
+
+        Args:
+            lb: array of lower bounds of the sampling intervals, in [0, 1].
+            ub: array of upper bounds of the sampling intervals, in [0, 1].
+        """
+        values = self._rng.uniform(lb, ub) * self._nodes[0]
+        idx = np.zeros(values.shape, dtype=np.int64)
+        for _ in range(self._depth):  # descend all paths in lockstep, one tree level at a time
+            left = 2 * idx + 1
+            left_p = self._nodes[left]
+            go_right = values >= left_p
+            idx = left + go_right
+            values -= go_right * left_p
+        return idx - self._leaves_offset
 
     def get(self, idx: int):
         """Returns the priority of a leaf node."""
-        return self._nodes[-1][idx]
+        return self._nodes[self._leaves_offset + idx]
+
+    def get_batch(self, idx: np.ndarray) -> np.ndarray:
+        """Returns the priorities of a batch of leaf nodes."""
+        return self._nodes[self._leaves_offset + idx]
 
     def set(self, idx: int, value: float = None):
         """Sets value of a node in the tree and updates its parents.
@@ -56,9 +73,31 @@ class SumTree:
             assert value > 0.0, f'sum tree cannot hold negative values, received: {value}'
             self._max_p = max(value, self._max_p)
 
-        delta = value - self._nodes[-1][idx]
+        idx += self._leaves_offset
+        delta = value - self._nodes[idx]
         # starting from this node, traverse the tree up to the root updating intermediate nodes
-        for nodes_depth_d in self._nodes[::-1]:
-            nodes_depth_d[idx] += delta
-            idx //= 2  # compute index of parent
+        self._nodes[idx] += delta
+        while idx > 0:
+            idx = (idx - 1) // 2  # compute index of parent
+            self._nodes[idx] += delta
 
+    def set_batch(self, idx: np.ndarray, values: np.ndarray = None):
+        """Sets values of a batch of nodes in the tree and updates their parents.
+
+        Args:
+            idx: indexes of the nodes to update. If an index is repeated, its last value is kept.
+            values: new priority values to store
+        """
+        if values is None:
+            values = np.full(idx.shape, self._max_p)
+        else:
+            assert np.all(values > 0.0), f'sum tree cannot hold negative values, received: {values}'
+            self._max_p = max(np.max(values), self._max_p)
+        # dedup indexes keeping the last value written, so that each node is updated once
+        idx, last = np.unique(idx[::-1], return_index=True)
+        idx = idx + self._leaves_offset
+        self._nodes[idx] = values[::-1][last]
+        # traverse the tree up to the root, recomputing each touched parent from its children
+        for _ in range(self._depth):
+            idx = np.unique((idx - 1) // 2)
+            self._nodes[idx] = self._nodes[2 * idx + 1] + self._nodes[2 * idx + 2]
@@ -1,4 +1,3 @@
-import random
 import gin
 from collections import deque
 
@@ -9,19 +8,30 @@ from pyagents.memory.buffer import Buffer
 
 @gin.configurable
 class UniformBuffer(Buffer):
+    FIELDS = ('state', 'action', 'reward', 'next_state', 'done')
 
     def __init__(self,
                  save_dir=None,
                  size=50000,
-                 n_step_return=1):
+                 n_step_return=1,
+                 state_dtype='float32',
+                 seed=None):
         super().__init__(save_dir)
+        self._state_dtype = np.dtype(state_dtype)  # e.g. float16 halves the memory footprint of states
+        if seed is None:  # derive the seed from the global numpy state, so that seeded runs stay reproducible
+            seed = np.random.randint(2 ** 31)
+        self._rng = np.random.default_rng(seed)
         self._n_step_return = n_step_return
         self._stmemory = deque(maxlen=n_step_return)
-        self._ltmemory = deque(maxlen=size)
-        self._config = {'size': size, 'n_step_return': n_step_return, 'type': 'uniform'}
+        self._size = size
+        self._ltmemory = None  # one preallocated array per experience field, allocated on first commit
+        self._ptr = 0  # ring buffer write index
+        self._len = 0  # number of stored memories
+        self._config = {'size': size, 'n_step_return': n_step_return, 'state_dtype': self._state_dtype.name,
+                        'type': 'uniform'}
 
     def __len__(self):
-        return len(self._ltmemory)
+        return self._len
 
     @property
     def n_step_return(self):
@@ -32,39 +42,78 @@ class UniformBuffer(Buffer):
 
     def commit_stmemory(self, fragment: np.ndarray, gamma: float = 0.99):
         states, actions, rewards, next_states, dones = fragment
-        batch_size = states.shape[0]  # first dim is input batch size, i.e. n_envs
         if self._n_step_return == 1:  # no actual multi step return
-            for b in range(batch_size):
-                lt_experience = {'state': states[b],
-                                 'action': actions[b],
-                                 'reward': rewards[b],
-                                 'next_state': next_states[b],
-                                 'done': dones[b]}
-                self.commit_ltmemory(lt_experience)
+            self.commit_ltmemory_batch({'state': states,
+                                        'action': actions,
+                                        'reward': rewards,
+                                        'next_state': next_states,
+                                        'done': dones})
         else:
             st_experience = {'states': states, 'actions': actions, 'rewards': rewards,
                              'next_states': next_states, 'dones': dones}
             if len(self._stmemory) == self._n_step_return:  # time to compute truncated multi step return
-                for b in range(batch_size):
-                    s_t = self._stmemory[0]['states'][b]
-                    a_t = self._stmemory[0]['actions'][b]
-                    r_tpn = 0
-                    for k, e_k in enumerate(self._stmemory):
-                        r_tpn += (gamma ** k) * e_k['rewards'][b]
-                        if e_k['dones'][b]:
-                            break
-                    s_tpn = e_k['next_states'][b]
-                    done_tpn = e_k['dones'][b]
-                    lt_experience = {'state': s_t, 'action': a_t, 'reward': r_tpn, 'next_state': s_tpn, 'done': done_tpn}
-                    self.commit_ltmemory(lt_experience)
+                # stack short term memory along first dim, shapes are (n_step_return, batch_size, ...)
+                rewards_n = np.stack([e_k['rewards'] for e_k in self._stmemory])
+                dones_n = np.stack([e_k['dones'] for e_k in self._stmemory]).astype(np.float32)
+                # rewards after the first done do not contribute, while the one at the done step does
+                alive = np.cumprod(np.concatenate([np.ones_like(dones_n[:1]), 1. - dones_n[:-1]]), axis=0)
+                gammas = gamma ** np.arange(self._n_step_return).reshape(-1, 1)
+                r_tpn = np.sum(gammas * rewards_n * alive, axis=0)
+                # last step of each truncated trajectory, i.e. the first done or the last stored step
+                last = np.where(dones_n.any(axis=0), dones_n.argmax(axis=0), self._n_step_return - 1)
+                batch_range = np.arange(last.shape[0])
+                s_tpn = np.stack([e_k['next_states'] for e_k in self._stmemory])[last, batch_range]
+                done_tpn = np.stack([e_k['dones'] for e_k in self._stmemory])[last, batch_range]
+                self.commit_ltmemory_batch({'state': self._stmemory[0]['states'],
+                                            'action': self._stmemory[0]['actions'],
+                                            'reward': r_tpn,
+                                            'next_state': s_tpn,
+                                            'done': done_tpn})
             self._stmemory.append(st_experience)
 
+    def _init_ltmemory(self, experience):
+        self._ltmemory = dict()
+        for k in self.FIELDS:
+            v = np.asarray(experience[k])
+            if k == 'action':
+                dtype = v.dtype
+            elif k in ('state', 'next_state'):
+                dtype = self._state_dtype
+            else:
+                dtype = np.float32
+            self._ltmemory[k] = np.empty((self._size,) + v.shape, dtype=dtype)
+
+    def _store(self, experiences) -> np.ndarray:
+        """Writes a batch of experiences at the ring buffer write index, and returns the indexes written.
+        Callers must hold the buffer lock."""
+        if self._ltmemory is None:
+            self._init_ltmemory({k: v[0] for k, v in experiences.items()})
+        indexes = (self._ptr + np.arange(len(experiences['state']))) % self._size
+        for k in self.FIELDS:
+            self._ltmemory[k][indexes] = experiences[k]
+        self._ptr = (indexes[-1] + 1) % self._size
+        self._len = min(self._len + len(indexes), self._size)
+        return indexes
+
     def commit_ltmemory(self, experience):
-        self._ltmemory.append(experience)
+        self.commit_ltmemory_batch({k: np.expand_dims(v, 0) for k, v in experience.items()})
+
+    def commit_ltmemory_batch(self, experiences):
+        """Commits a batch of experiences, given as a dict of arrays with the batch along the first dim."""
+        with self._lock:
+            self._store(experiences)
 
     def sample(self, batch_size, vectorizing_fn=lambda x: x):
         # no need to return samples indexes, and is_weights contains all ones (as it's not used)
-        # compute samples, convert into tuple for retrocompatibily TODO switch to better dict interface
-        samples = random.sample(self._ltmemory, batch_size)
-        samples = list(map(lambda d: tuple(d.values()), samples))
+        # samples are returned as a tuple of arrays, one per experience field
+        with self._lock:
+            indexes = self._rng.integers(0, self._len, size=batch_size)
+            samples = self._gather(indexes)
         return vectorizing_fn(samples), [], np.ones(batch_size)
+
+    def _gather(self, indexes) -> tuple:
+        """Returns the memories at given indexes as a tuple of arrays, one per experience field, with states cast
+        back to float32. Callers must hold the buffer lock."""
+        return tuple(self._ltmemory[k][indexes].astype(np.float32, copy=False) if k in ('state', 'next_state')
+                     else self._ltmemory[k][indexes]
+                     for k in self.FIELDS)
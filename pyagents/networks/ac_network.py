@@ -60,8 +60,8 @@ class ACNetwork(Network):
 
     def call(self, inputs, training=True, mask=None) -> NetworkOutput:
         pi_out = self._policy_net(inputs, training=training)
-        act = pi_out.action
+        act = pi_out.actions
         critic_out = self._critic_net((inputs, act), training=training)
-        return NetworkOutput(action=act,
+        return NetworkOutput(actions=act,
                              dist_params=pi_out.dist_params,
                              critic_values=critic_out.critic_values)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import gin
 import numpy as np
 import tensorflow as tf
@@ -22,7 +24,8 @@ class DiscreteQNetwork(Network):
                  do_init: bool = True,
                  name='QNetwork',
                  trainable=True,
-                 dtype: str = 'float32'):
+                 dtype: str = 'float32',
+                 compute_dtype: Optional[str] = None):
         super().__init__(name=name, trainable=trainable, dtype=dtype)
         self._config = {'state_shape': state_shape,
                         'action_shape': action_shape,
@@ -34,7 +37,8 @@ class DiscreteQNetwork(Network):
                         'dueling': dueling,
                         'do_init': do_init,
                         'name': name,
-                        'dtype': dtype}
+                        'dtype': dtype,
+                        'compute_dtype': compute_dtype}
         self._encoder = EncodingNetwork(
             state_shape,
             conv_params=conv_params,
@@ -44,6 +48,7 @@ class DiscreteQNetwork(Network):
             activation=activation,
             name=name,
             dtype=dtype,
+            compute_dtype=compute_dtype,
             do_init=do_init
         )
         self._q_layer = QLayer(action_shape,
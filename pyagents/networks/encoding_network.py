@@ -1,3 +1,5 @@
+from typing import Optional
+
 import gin
 import numpy as np
 import tensorflow as tf
@@ -16,6 +18,7 @@ class EncodingNetwork(Network):
                  activation='tanh',
                  noisy_layers=False,
                  dtype: str = 'float32',
+                 compute_dtype: Optional[str] = None,
                  do_init: bool = True,
                  name='EncodingNetwork',
                  conv_type='2d'):
@@ -31,7 +34,10 @@ class EncodingNetwork(Network):
                         'do_init': do_init,
                         'noisi_layers': noisy_layers,
                         'dtype': dtype,
+                        'compute_dtype': compute_dtype,
                         'conv_type': conv_type}
+        # with a compute dtype, hidden layers run in mixed precision (variables are still kept in dtype)
+        layers_dtype = tf.keras.mixed_precision.Policy(f'mixed_{compute_dtype}') if compute_dtype else dtype
 
         # TODO improve inizialization, allow initizializer to be passed as parameter
         kernel_initializer = tf.keras.initializers.Orthogonal(0.1)
@@ -60,9 +66,9 @@ class EncodingNetwork(Network):
                                               dilation_rate=dilation_rate,
                                               activation=activation,
                                               kernel_initializer=kernel_initializer,
-                                              dtype=dtype))
+                                              dtype=layers_dtype))
 
-        layers.append(tf.keras.layers.Flatten())
+        layers.append(tf.keras.layers.Flatten(dtype=layers_dtype))
         if not dropout_params:
             dropout_params = None
         if dropout_params is None or isinstance(dropout_params, float):
@@ -84,9 +90,9 @@ class EncodingNetwork(Network):
                     activation=activation,
                     kernel_initializer=kernel_initializer,
                     kernel_regularizer=kernel_regularizer,
-                    dtype=dtype))
+                    dtype=layers_dtype))
                 if dropout is not None:
-                    layers.append(tf.keras.layers.Dropout(rate=dropout))
+                    layers.append(tf.keras.layers.Dropout(rate=dropout, dtype=layers_dtype))
 
         self._postprocessing_layers = layers
         if do_init:
@@ -96,7 +102,7 @@ class EncodingNetwork(Network):
         states = inputs
         for layer in self._postprocessing_layers:
             states = layer(states, training=training)
-        return states
+        return tf.cast(states, self.dtype)  # output layers downstream always work in full precision
 
     def get_config(self):
         config = super(EncodingNetwork, self).get_config()
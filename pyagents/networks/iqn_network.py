@@ -63,12 +63,12 @@ class IQNetwork(Network):
         self._q_layer.reset_noise()
 
     def call(self, inputs, training=False, mask=None, num_samples=32):
-        batch_size = inputs.shape[0]
+        batch_size = tf.shape(inputs)[0]  # dynamic, so that the network can be traced for any batch size
         state = self._encoder(inputs, training=training)
 
         taus = tf.random.uniform((batch_size, num_samples, 1), 0, 1)
         taus_emb = self._tau_embedding_net(tf.cos(self.pis * taus))
-        assert taus_emb.shape == (batch_size, num_samples, self._tau_embedding_size)
+        assert taus_emb.shape[1:] == (num_samples, self._tau_embedding_size)
         state = tf.reshape(tf.expand_dims(state, 1) * taus_emb, (-1, self._tau_embedding_size))
         # the full distribution, at each sampled quantile
         zvals = tf.reshape(self._q_layer(state), (batch_size, num_samples, -1))
@@ -21,6 +21,11 @@ class Network(tf.keras.layers.Layer, ABC):
     def from_config(cls, config):
         return cls(**config)
 
+    def copy(self) -> 'Network':
+        """Returns a new, unbuilt network with the same configuration as this one.
+        Once built, weights can be synced with agent.update_target(..., tau=1.0)."""
+        return self.from_config(self.get_config())
+
     @property
     def variables(self):
         if not self.built:
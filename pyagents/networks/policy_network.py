@@ -26,7 +26,8 @@ class PolicyNetwork(Network):
                  do_init: bool = True,
                  name: str = 'PolicyNetwork',
                  trainable: bool = True,
-                 dtype: str = 'float32'):
+                 dtype: str = 'float32',
+                 compute_dtype: Optional[str] = None):
         """Creates a Policy Network.
 
         Args:
@@ -45,6 +46,8 @@ class PolicyNetwork(Network):
             name:  Name of the network. Defaults to 'ActorNetwork'.
             trainable: if True, network is trainable. Defaults to True.
             dtype: Network dtype. Defaults to tf.float32.
+            compute_dtype: (Optional) Dtype used for encoder computations, e.g. 'bfloat16' or 'float16' for
+              mixed precision. Variables and output layer stay in dtype. Defaults to None (same as dtype).
         """
         super(PolicyNetwork, self).__init__(name, trainable, dtype)
         self._config = {'state_shape': state_shape,
@@ -58,7 +61,8 @@ class PolicyNetwork(Network):
                         'out_params': out_params,
                         'do_init': do_init,
                         'name': name,
-                        'dtype': dtype}
+                        'dtype': dtype,
+                        'compute_dtype': compute_dtype}
         if out_params is None:
             out_params = {}
         if conv_params is None and fc_params is None:
@@ -70,6 +74,7 @@ class PolicyNetwork(Network):
                 fc_params=fc_params,
                 dropout_params=dropout_params,
                 activation=activation,
+                compute_dtype=compute_dtype,
                 do_init=do_init,
             )
         assert bounds is None or len(bounds) == 2, f'wrong bounds param: {bounds}'
@@ -91,31 +96,40 @@ class PolicyNetwork(Network):
             self._out_layer = SoftmaxLayer(features_shape, action_shape, **out_params)
         else:
             raise ValueError(f'unknown output type {output}')
+        self._policies = {}  # policy objects built by get_policy, keyed by id of the calling network
         if do_init:
             self(tf.ones((1, *state_shape)))
 
     def get_policy(self, caller=None):
         """Returns a Policy object that represents the this network's current policy."""
         # caller parameter is used when this network is not the main network (eg when used as policy head)
+        policy_network = caller if caller is not None else self
+        if id(policy_network) not in self._policies:
+            self._policies[id(policy_network)] = self._make_policy(policy_network)
+        return self._policies[id(policy_network)]
+
+    def _make_policy(self, policy_network):
+        # the policy observes the inputs of the calling network, which differ from this one's when used as a head
+        state_shape = policy_network.get_config()['state_shape']
         if self._output_type == 'continuous':
-            return FixedPolicy(state_shape=self._config['state_shape'],
+            return FixedPolicy(state_shape=state_shape,
                                action_shape=self._config['action_shape'],
-                               policy_network=caller if caller is not None else self,
+                               policy_network=policy_network,
                                bounds=self._bounds)
         elif self._output_type == 'gaussian':
-            return GaussianPolicy(state_shape=self._config['state_shape'],
+            return GaussianPolicy(state_shape=state_shape,
                                   action_shape=self._config['action_shape'],
-                                  policy_network=caller if caller is not None else self,
+                                  policy_network=policy_network,
                                   bounds=self._bounds)
         elif self._output_type == 'beta':
-            return DirichletPolicy(state_shape=self._config['state_shape'],
+            return DirichletPolicy(state_shape=state_shape,
                                    action_shape=self._config['action_shape'],
-                                   policy_network=caller if caller is not None else self,
+                                   policy_network=policy_network,
                                    bounds=self._bounds)
         elif self._output_type == 'softmax':
-            return SoftmaxPolicy(state_shape=self._config['state_shape'],
+            return SoftmaxPolicy(state_shape=state_shape,
                                  action_shape=self._config['action_shape'],
-                                 policy_network=caller if caller is not None else self)
+                                 policy_network=policy_network)
 
     def get_config(self):
         config = super().get_config()
@@ -71,6 +71,7 @@ class SharedBackboneACNetwork(Network):
         state = self._backbone(inputs, training=training)
         pi_out = self._policy_head(state)
         critic_out = self._critic_head(state)
-        return NetworkOutput(actions=pi_out.action,
+        return NetworkOutput(actions=pi_out.actions,
                              dist_params=pi_out.dist_params,
-                             critic_values=critic_out.critic_values)
+                             critic_values=critic_out.critic_values,
+                             logprobs=pi_out.logprobs)
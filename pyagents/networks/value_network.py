@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Optional, Union
 
 import gin
 import numpy as np
@@ -19,7 +19,8 @@ class ValueNetwork(Network):
                  do_init: bool = True,
                  name: str = 'ValueNetwork',
                  trainable: bool = True,
-                 dtype: str = 'float32'):
+                 dtype: str = 'float32',
+                 compute_dtype: Optional[str] = None):
         super(ValueNetwork, self).__init__(name, trainable, dtype)
         self._config = {'state_shape': state_shape,
                         'conv_params': conv_params if conv_params else [],
@@ -28,7 +29,8 @@ class ValueNetwork(Network):
                         'activation': activation,
                         'name': name,
                         'do_init': do_init,
-                        'dtype': dtype}
+                        'dtype': dtype,
+                        'compute_dtype': compute_dtype}
         if conv_params is None and fc_params is None:
             self._encoder = None
         else:
@@ -39,6 +41,7 @@ class ValueNetwork(Network):
                 dropout_params=dropout_params,
                 activation=activation,
                 dtype=dtype,
+                compute_dtype=compute_dtype,
                 do_init=do_init
             )
         self._value_head = tf.keras.layers.Dense(1,
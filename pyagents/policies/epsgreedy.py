@@ -1,6 +1,8 @@
 import gin
 import numpy as np
+import tensorflow as tf
 from pyagents.policies.policy import Policy
+from pyagents.policies.qpolicy import QPolicy
 from pyagents.policies.randomdiscretepolicy import RandomDiscretePolicy
 
 
@@ -11,17 +13,24 @@ class EpsGreedyPolicy(Policy):
         self._policy = policy
         self._random_policy = RandomDiscretePolicy(self._policy.state_shape, self._policy.action_shape)
         self._epsilon = epsilon
+        self._epsilon_var = tf.Variable(epsilon, dtype=tf.float32, trainable=False)  # read by the fused q policy graph
         self._epsilon_decay = epsilon_decay
         self._epsilon_min = epsilon_min
         super().__init__(self._policy.state_shape, self._policy.action_shape)
 
     def update_eps(self):
-        self._epsilon = max(self._epsilon_min, self._epsilon * self._epsilon_decay)
+        # epsilon is only ever changed through its setter, so once fully decayed the variable is already in sync
+        if self._epsilon <= self._epsilon_min:
+            return
+        self.epsilon = max(self._epsilon_min, self._epsilon * self._epsilon_decay)
 
     @property
     def is_discrete(self):
         return True  # TODO should also work for continuous policies
 
+    def warmup(self, training=True):
+        self._policy.warmup(training=training)
+
     def log_prob(self, output, action):
         raise NotImplementedError('method not exposed by eps greedy')
 
@@ -32,8 +41,16 @@ class EpsGreedyPolicy(Policy):
     def epsilon(self):
         return self._epsilon
 
+    @epsilon.setter
+    def epsilon(self, value):
+        """Sets epsilon, keeping in sync the variable read by the fused q policy graph."""
+        self._epsilon = value
+        self._epsilon_var.assign(value)
+
     def _act(self, obs, mask=None, training=True):
-        if training and np.random.rand() <= self._epsilon:
+        if training and mask is None and isinstance(self._policy, QPolicy):
+            return self._policy.act_eps_greedy(obs, self._epsilon_var)
+        elif training and np.random.rand() <= self._epsilon:
             return self._random_policy.act(obs, mask=mask, training=training)
         else:
             return self._policy.act(obs, mask=mask, training=training)
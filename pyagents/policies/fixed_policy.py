@@ -1,5 +1,8 @@
+import functools
+
 import numpy as np
 import gin
+import tensorflow as tf
 
 from pyagents.policies.policy import Policy, PolicyOutput
 
@@ -15,6 +18,11 @@ class FixedPolicy(Policy):
         super(FixedPolicy, self).__init__(state_shape, action_shape)
         self._policy_network = policy_network
         self._bounds = bounds
+        # cached graphs for the forward pass (one per training mode), traced once for any batch size
+        signature = [tf.TensorSpec((None,) + tuple(state_shape), tf.float32)]
+        self._forward = {training: tf.function(functools.partial(self._pi_forward, training=training),
+                                               input_signature=signature)
+                         for training in (True, False)}
 
     @property
     def is_discrete(self):
@@ -24,8 +32,14 @@ class FixedPolicy(Policy):
     def bounds(self):
         return self._bounds
 
-    def _act(self, obs, **kwargs):
-        action = self._policy_network(obs, **kwargs).action
+    def warmup(self, training=True):
+        self._forward[bool(training)].get_concrete_function()
+
+    def _pi_forward(self, obs, training):
+        return self._policy_network(obs, training=training).actions
+
+    def _act(self, obs, mask=None, training=True):
+        action = self._forward[bool(training)](tf.convert_to_tensor(obs, dtype=tf.float32)).numpy()
         if self._bounds is not None:
             action = np.clip(action, self._bounds[0], self._bounds[1])
         return PolicyOutput(actions=action)
@@ -1,3 +1,5 @@
+import functools
+
 import gin
 import numpy as np
 import tensorflow_probability as tfp
@@ -16,6 +18,11 @@ class GaussianPolicy(Policy):
         super().__init__(state_shape, action_shape)
         self._policy_network = policy_network
         self._bounds = bounds
+        # cached graphs for the forward pass (one per training mode), traced once for any batch size
+        signature = [tf.TensorSpec((None,) + tuple(state_shape), tf.float32)]
+        self._forward = {training: tf.function(functools.partial(self._pi_forward, training=training),
+                                               input_signature=signature)
+                         for training in (True, False)}
 
     @property
     def is_discrete(self):
@@ -25,11 +32,16 @@ class GaussianPolicy(Policy):
     def bounds(self):
         return self._bounds
 
-    def _act(self, obs, deterministic=False, mask=None, training=True):
+    def warmup(self, training=True):
+        self._forward[bool(training)].get_concrete_function()
+
+    def _pi_forward(self, obs, training):
         pi_out = self._policy_network(obs, training=training)
-        action = pi_out.actions.numpy()
-        lp = pi_out.logprobs.numpy()
-        return PolicyOutput(actions=action, logprobs=lp)
+        return pi_out.actions, pi_out.logprobs
+
+    def _act(self, obs, deterministic=False, mask=None, training=True):
+        action, lp = self._forward[bool(training)](tf.convert_to_tensor(obs, dtype=tf.float32))
+        return PolicyOutput(actions=action.numpy(), logprobs=lp.numpy())
 
     def entropy(self, output):
         if self._action_shape == (1,):  # orribile
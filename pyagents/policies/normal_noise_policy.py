@@ -1,7 +1,7 @@
 from typing import Optional
 
 import gin
-import tensorflow as tf
+import numpy as np
 from pyagents.policies import Policy
 from pyagents.policies.policy import PolicyOutput
 
@@ -29,13 +29,16 @@ class NormalNoisePolicy(Policy):
     def bounds(self):
         return self._bounds
 
+    def warmup(self, training=True):
+        self._policy.warmup(training=training)
+
     def _act(self, obs, mask=None, training=True, **kwargs):
         action = self._policy.act(obs, mask=mask, training=training).actions
+        # wrapped policy returns numpy actions, so noise and clipping stay on host (one sample for each env)
         if training:
-            eps = tf.random.normal(self._policy.action_shape, mean=0.0, stddev=self._stddev)
-            action += eps
+            action = action + np.random.normal(0.0, self._stddev, size=action.shape).astype(action.dtype)
         if self._bounds is not None:
-            action = tf.clip_by_value(action, self._bounds[0], self._bounds[1])
+            action = np.clip(action, self._bounds[0], self._bounds[1])
         if self._decay is not None:
             self._stddev = min(self._stddev * self._decay, self._stddev_min)
         return PolicyOutput(actions=action)
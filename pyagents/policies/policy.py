@@ -16,6 +16,11 @@ class Policy(ABC):
     def act(self, obs, mask=None, training=True) -> PolicyOutput:
         return self._act(obs, mask=mask, training=training)
 
+    def warmup(self, training=True):
+        """Traces the cached acting graphs used in the given training mode, without executing them.
+        Policies without cached graphs do nothing."""
+        pass
+
     def distribution(self, obs):
         return self._distribution(obs)
 
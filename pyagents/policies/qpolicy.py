@@ -8,15 +8,52 @@ class QPolicy(Policy):
     def __init__(self, state_shape, action_shape, q_network):
         super().__init__(state_shape, action_shape)
         self._q_network = q_network
+        # cached graph for the (unmasked) forward pass, traced once for any batch size
+        self._forward = tf.function(self._q_forward,
+                                    input_signature=[tf.TensorSpec((None,) + tuple(state_shape), tf.float32)])
+        self._eps_greedy_forward = tf.function(self._q_eps_greedy_forward,
+                                               input_signature=[tf.TensorSpec((None,) + tuple(state_shape), tf.float32),
+                                                                tf.TensorSpec((), tf.float32)])
 
     @property
     def is_discrete(self):
         return True
 
+    def warmup(self, training=True):
+        self._forward.get_concrete_function()
+        if training:
+            self._eps_greedy_forward.get_concrete_function()
+
+    def _q_forward(self, obs):
+        q_out = self._q_network(obs)
+        return q_out.actions, q_out.critic_values
+
+    def _q_eps_greedy_forward(self, obs, epsilon):
+        q_out = self._q_network(obs)
+        batch_size = tf.shape(obs)[0]
+        # independent exploration choice for each observation in the batch
+        explore = tf.random.uniform((batch_size,)) <= epsilon
+        random_actions = tf.random.uniform((batch_size,), 0, self._action_shape, dtype=q_out.actions.dtype)
+        return tf.where(explore, random_actions, q_out.actions), q_out.critic_values
+
+    def act_eps_greedy(self, obs, epsilon):
+        """Epsilon-greedy action selection, entirely computed inside the cached graph.
+
+        Args:
+            obs: batch of observations.
+            epsilon: probability of taking a random action, can be a tf.Variable to avoid retracing.
+        """
+        actions, qvals = self._eps_greedy_forward(tf.convert_to_tensor(obs, dtype=tf.float32), epsilon)
+        return PolicyOutput(values=qvals, actions=actions.numpy())
+
     def _act(self, obs, mask=None, training=True):
-        q_out = self._q_network(obs, mask=mask)
-        return PolicyOutput(values=q_out.critic_values, actions=q_out.actions.numpy())
+        if mask is None:
+            actions, qvals = self._forward(tf.convert_to_tensor(obs, dtype=tf.float32))
+        else:
+            q_out = self._q_network(obs, mask=mask)
+            actions, qvals = q_out.actions, q_out.critic_values
+        return PolicyOutput(values=qvals, actions=actions.numpy())
 
     def _distribution(self, obs):
-        qvals = self._q_network(obs.reshape(1, *obs.shape))
+        _, qvals = self._forward(tf.convert_to_tensor(obs[None, ...], dtype=tf.float32))
         return qvals / tf.reduce_sum(qvals)
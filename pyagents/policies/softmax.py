@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 import tensorflow as tf
 import tensorflow_probability as tfp
@@ -14,12 +16,22 @@ class SoftmaxPolicy(Policy):
     def __init__(self, state_shape, action_shape, policy_network):
         super().__init__(state_shape, action_shape)
         self._policy_network = policy_network
+        # cached graphs for the forward pass (one per training mode), traced once for any batch size
+        signature = [tf.TensorSpec((None,) + tuple(state_shape), tf.float32)]
+        self._forward = {training: tf.function(functools.partial(self._pi_forward, training=training),
+                                               input_signature=signature)
+                         for training in (True, False)}
 
-    def _act(self, obs, mask=None, training=True) -> PolicyOutput:
+    def warmup(self, training=True):
+        self._forward[bool(training)].get_concrete_function()
+
+    def _pi_forward(self, obs, training):
         pi_out = self._policy_network(obs, training=training)
-        act = pi_out.actions.numpy()
-        lp = pi_out.logprobs.numpy()
-        return PolicyOutput(actions=act, logprobs=lp)
+        return pi_out.actions, pi_out.logprobs
+
+    def _act(self, obs, mask=None, training=True) -> PolicyOutput:
+        act, lp = self._forward[bool(training)](tf.convert_to_tensor(obs, dtype=tf.float32))
+        return PolicyOutput(actions=act.numpy(), logprobs=lp.numpy())
 
     def entropy(self, output):
         dist = tfp.distributions.Categorical(logits=output)
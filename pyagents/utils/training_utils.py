@@ -1,6 +1,6 @@
 import os
 import random
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import gymnasium as gym
 import numpy as np
@@ -14,6 +14,26 @@ import pyagents.agents as agents
 import pyagents.networks as networks
 
 
+class RollingMean:
+    """Mean of the last window values, updated in O(1) for each new value."""
+
+    def __init__(self, window: int = 100):
+        self._values = deque(maxlen=window)
+        self._sum = 0.
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value: float):
+        if len(self._values) == self._values.maxlen:
+            self._sum -= self._values[0]  # value about to be evicted
+        self._values.append(value)
+        self._sum += value
+
+    def mean(self) -> float:
+        return self._sum / len(self._values)
+
+
 @gin.configurable
 def get_optimizer(learning_rate=0.001):
     return Adam(learning_rate=learning_rate)
@@ -22,7 +42,7 @@ def get_optimizer(learning_rate=0.001):
 @gin.configurable
 def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='uniform',
               crit_start_learning_rate=None, alpha_start_learning_rate=None, schedule=True, wandb_params=None,
-              gym_id=None, training_steps=10 ** 5,
+              gym_id=None, training_steps=10 ** 5, compute_dtype=None, jit_compile=True,
               log_dict=None):
     if log_dict is None:
         log_dict = dict()
@@ -63,8 +83,9 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
     if algo in ('vpg', 'ppo'):
         if isinstance(action_space, gym.spaces.Discrete):
             action_shape = (action_shape,)
-        a_net = networks.PolicyNetwork(state_shape, action_shape, output=output, bounds=bounds)
-        v_net = networks.ValueNetwork(state_shape)
+        a_net = networks.PolicyNetwork(state_shape, action_shape, output=output, bounds=bounds,
+                                       compute_dtype=compute_dtype)
+        v_net = networks.ValueNetwork(state_shape, compute_dtype=compute_dtype)
         a_opt = get_optimizer(learning_rate=act_learning_rate)
         v_opt = get_optimizer(learning_rate=crit_learning_rate)
         log_dict['actor_learning_rate'] = act_start_learning_rate
@@ -72,46 +93,48 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
         if algo == 'vpg':
             agent = agents.VPG(state_shape, action_shape,
                                actor=a_net, critic=v_net, actor_opt=a_opt, critic_opt=v_opt,
-                               name='vpg', wandb_params=wandb_params, save_dir=output_dir,
+                               name='vpg', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                log_dict=log_dict)
         else:
             agent = agents.PPO(state_shape, action_shape,
                                actor=a_net, critic=v_net, actor_opt=a_opt, critic_opt=v_opt,
-                               name='ppo', wandb_params=wandb_params, save_dir=output_dir,
+                               name='ppo', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                log_dict=log_dict)
     elif algo == 'a2c':
+        if isinstance(action_space, gym.spaces.Discrete):
+            action_shape = (action_shape,)
         ac_net = networks.SharedBackboneACNetwork(state_shape, action_shape, output=output, bounds=bounds)
         opt = get_optimizer(learning_rate=act_learning_rate)
         log_dict['learning_rate'] = act_start_learning_rate
         agent = agents.A2C(state_shape, action_shape, actor_critic=ac_net, opt=opt,
-                           name='a2c', wandb_params=wandb_params, save_dir=output_dir,
+                           name='a2c', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                            log_dict=log_dict)
     elif algo == 'dqn':
         assert isinstance(action_space, gym.spaces.Discrete), 'DQN only works in discrete environments'
         action_shape = action_space.n
         log_dict['learning_rate'] = act_start_learning_rate
-        q_net = networks.DiscreteQNetwork(state_shape, action_shape)
+        q_net = networks.DiscreteQNetwork(state_shape, action_shape, compute_dtype=compute_dtype)
         optim = Adam(learning_rate=act_learning_rate)
         agent = agents.DQNAgent(state_shape, action_shape, q_network=q_net, buffer=buffer, optimizer=optim,
-                                name='dqn', wandb_params=wandb_params, save_dir=output_dir,
+                                name='dqn', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                 log_dict=log_dict)
     elif algo == 'c51':
         assert isinstance(action_space, gym.spaces.Discrete), 'DQN only works in discrete environments'
         action_shape = action_space.n
-        log_dict['learning_rate'] = act_learning_rate
+        log_dict['learning_rate'] = act_start_learning_rate
         q_net = networks.C51QNetwork(state_shape, action_shape)
         optim = get_optimizer(act_learning_rate)
         agent = agents.C51DQNAgent(state_shape, action_shape, q_net, buffer=buffer, optimizer=optim,
-                                   name='c51', wandb_params=wandb_params, save_dir=output_dir,
+                                   name='c51', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                    log_dict=log_dict)
     elif algo == 'qrdqn':
         assert isinstance(action_space, gym.spaces.Discrete), 'DQN only works in discrete environments'
         action_shape = action_space.n
-        log_dict['learning_rate'] = act_learning_rate
+        log_dict['learning_rate'] = act_start_learning_rate
         q_net = networks.QRQNetwork(state_shape, action_shape)
         optim = Adam(learning_rate=act_learning_rate, epsilon=0.01 / 32)
         agent = agents.QRDQNAgent(state_shape, action_shape, q_net, buffer=buffer, optimizer=optim,
-                                  name='qrdqn', wandb_params=wandb_params, save_dir=output_dir,
+                                  name='qrdqn', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                   log_dict=log_dict)
 
     elif algo == 'ddpg':
@@ -127,7 +150,8 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
         log_dict['critic_learning_rate'] = crit_start_learning_rate
         agent = agents.DDPG(state_shape, action_shape, actor_critic=ac, buffer=buffer,
                             actor_opt=a_opt, critic_opt=c_opt,
-                            action_bounds=bounds, name='ddpg', wandb_params=wandb_params, save_dir=output_dir,
+                            action_bounds=bounds, name='ddpg', jit_compile=jit_compile,
+                            wandb_params=wandb_params, save_dir=output_dir,
                             log_dict=log_dict)
     elif algo == 'sac':
         assert isinstance(action_space, gym.spaces.Box), 'sac only works in continuous spaces'
@@ -147,7 +171,7 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
         agent = agents.SAC(state_shape, action_shape, actor=a_net, buffer=buffer,
                            critic=q1_net, actor_opt=a_opt, critic1_opt=c1_opt,
                            critic2=q2_net, critic2_opt=c2_opt,
-                           alpha_opt=alpha_opt, wandb_params=wandb_params, save_dir=output_dir,
+                           alpha_opt=alpha_opt, jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                            log_dict={'actor_learning_rate': act_start_learning_rate,
                                      'critic_learning_rate': crit_start_learning_rate,
                                      'alpha_learning_rate': alpha_start_learning_rate})
@@ -158,7 +182,7 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
         q_net = networks.IQNetwork(state_shape, action_shape)
         optim = get_optimizer(act_start_learning_rate)
         agent = agents.IQNAgent(state_shape, action_shape, q_net, buffer=buffer, optimizer=optim,
-                                name='iqn', wandb_params=wandb_params, save_dir=output_dir,
+                                name='iqn', jit_compile=jit_compile, wandb_params=wandb_params, save_dir=output_dir,
                                 log_dict=log_dict)
     else:
         raise ValueError(f'unsupported algorithm {algo}')
@@ -168,6 +192,7 @@ def get_agent(algo, env, output_dir, act_start_learning_rate=3e-4, buffer='unifo
 def get_train_step_fn(batch_size=128, rollout_steps=100, update_rounds=1):
     def train_step(agent, envs, s_t):
         train_info = defaultdict(lambda: list())
+        rollout = defaultdict(lambda: list())  # experiences are collected and stored at once after the rollout
         for _ in range(rollout_steps):
             agent_out = agent.act(s_t)
             a_t, lp_t = agent_out.actions, agent_out.logprobs
@@ -177,56 +202,27 @@ def get_train_step_fn(batch_size=128, rollout_steps=100, update_rounds=1):
                     train_info['avg_ret'].append(single_step['episode']['r'])
                     train_info['avg_len'].append(single_step['episode']['l'])
 
-            agent.remember(state=s_t,
-                           action=a_t,
-                           reward=r_t,
-                           next_state=s_tp1,
-                           done=terminated,
-                           logprob=lp_t)
+            rollout['states'].append(s_t)
+            rollout['actions'].append(a_t)
+            rollout['rewards'].append(r_t)
+            rollout['next_states'].append(s_tp1)
+            rollout['dones'].append(terminated)
+            if lp_t is not None:
+                rollout['logprobs'].append(lp_t)
             s_t = s_tp1
 
+        agent.remember_batch(**{k: np.stack(v) for k, v in rollout.items()})
+
         # training
         if agent.on_policy:
             loss_dict = agent.train(batch_size, update_rounds=update_rounds)
         else:
-            loss_dict = defaultdict(lambda: 0)  # keeps track of average losses
+            loss_sums = defaultdict(lambda: 0.)  # running sums of losses, averaged once after all updates
             for _ in range(update_rounds):
                 epoch_info = agent.train(batch_size)
                 for loss, value in epoch_info.items():
-                    loss_dict[loss] += (value / update_rounds)
-
-        train_info['train_step'] = agent.train_step
-        train_info = {**train_info, **loss_dict}
-        return s_t, train_info
-
-    return train_step
-
-
-def train_off_policy_agent(batch_size=128, rollout_steps=100, update_rounds=1):
-    def train_step(agent, envs, s_t):
-        train_info = defaultdict(lambda: list())
-        for _ in range(rollout_steps):
-            agent_out = agent.act(s_t)
-            a_t, lp_t = agent_out.actions, agent_out.logprobs
-            s_tp1, r_t, terminated, truncated, info = envs.step(a_t)
-            if 'final_info' in info:
-                for single_step in filter(lambda x: x is not None, info['final_info']):
-                    train_info['avg_ret'].append(single_step['episode']['r'])
-                    train_info['avg_len'].append(single_step['episode']['l'])
-
-            agent.remember(state=s_t,
-                           action=a_t,
-                           reward=r_t,
-                           next_state=s_tp1,
-                           done=terminated,
-                           logprob=lp_t)
-            s_t = s_tp1
-
-        loss_dict = defaultdict(lambda: 0)  # keeps track of average losses
-        for _ in range(update_rounds):
-            epoch_info = agent.train(batch_size)
-            for loss, value in epoch_info.items():
-                loss_dict[loss] += (value / update_rounds)
+                    loss_sums[loss] += value
+            loss_dict = {loss: value / update_rounds for loss, value in loss_sums.items()}
 
         train_info['train_step'] = agent.train_step
         train_info = {**train_info, **loss_dict}
@@ -258,6 +254,8 @@ def train_agent(agent, train_envs, test_env=None, train_step_fn=None, training_s
     if agent.is_logging:
         wandb.log({'train_step': 0, 'test/score': np.mean(scores)})
     info = dict(avg_ret=np.mean(scores), avg_len=0)
+    # training returns and lengths are averaged over the last 100 completed episodes
+    avg_ret, avg_len = RollingMean(100), RollingMean(100)
     print(f'{"*" * 42}\nSTARTING TRAINING\n{"*" * 42}')
     with tqdm(total=training_steps) as pbar:
         pbar.set_description('INITIALIZING')
@@ -273,6 +271,7 @@ def train_agent(agent, train_envs, test_env=None, train_step_fn=None, training_s
             agent.init(train_envs, rollout_steps, env_config=env_config, **init_params)
         else:
             agent.init(train_envs, env_config=env_config, **init_params)
+        agent.warmup()
 
         state, new_info = train_envs.reset() #seed=seed
         info.update(new_info)
@@ -280,9 +279,16 @@ def train_agent(agent, train_envs, test_env=None, train_step_fn=None, training_s
         if not unique_seed:
             seed = ((seed ** 2) + 33) // 2  # generate new random seed for testing, pretty arbitrary here
         pbar.set_description('TRAINING')
+        is_logging = agent.is_logging
         while training_step <= training_steps:
             state, new_info = train_step_fn(agent, train_envs, s_t=state)
             training_step += update_rounds
+            for ep_ret, ep_len in zip(new_info.pop('avg_ret', ()), new_info.pop('avg_len', ())):
+                avg_ret.append(np.asarray(ep_ret).item())
+                avg_len.append(np.asarray(ep_len).item())
+            if len(avg_ret) > 0:
+                info['avg_ret'] = avg_ret.mean()
+                info['avg_len'] = avg_len.mean()
             info.update(new_info)
 
             if test_env is not None and training_step > ver * test_every:
@@ -296,13 +302,11 @@ def train_agent(agent, train_envs, test_env=None, train_step_fn=None, training_s
                 info['test/score'] = avg_score
                 pbar.set_description(f'[EVAL SCORE: {avg_score:4.0f}] TRAINING')
 
-            if agent.is_logging:
-                info['avg_ret'] = np.mean(info['avg_ret'])
-                info['avg_len'] = np.mean(info['avg_len'])
+            if is_logging:
                 wandb.log(info)
 
             pbar.update(update_rounds)
-            pbar.set_postfix(**info)
+            pbar.set_postfix(refresh=False, **info)  # redrawn by update(), which is rate limited
 
     agent.save(ver=0)
     return agent, scores
@@ -311,8 +315,7 @@ def train_agent(agent, train_envs, test_env=None, train_step_fn=None, training_s
 def test_agent(agent, envs, seed, n_episodes):
     def no_vec_test(env, s_t):
         score, episode = 0, 0
-        s_t = tf.expand_dims(s_t, axis=0)
-        a_t = agent.act(s_t, training=False).actions[0]
+        a_t = agent.act(s_t[np.newaxis], training=False).actions[0]  # batch dim added as a view
         s_tp1, _, terminated, truncated, info = env.step(a_t)
         if "episode" in info.keys():
             score = [info['episode']['r']]
@@ -377,9 +380,18 @@ def get_envs(n_envs, gym_id, seed, capture_video, output_dir, frame_stack=1, asy
         def thunk():
             if not os.path.isdir(output_dir):
                 os.mkdir(output_dir)
-            env = gym.make(gym_id, render_mode='human' if capture_video else None)
-
-            if capture_video and idx == 0:
+            record_video = capture_video and idx == 0
+            # frames are only rendered (off-screen) for the recorded env, never in the training loop
+            env = gym.make(gym_id, render_mode='rgb_array' if record_video else None)
+            obs_space = env.observation_space
+            if isinstance(obs_space, gym.spaces.Box) and obs_space.dtype == np.float64:
+                # cast observations once at the env boundary, so that downstream code only sees float32
+                env = gym.wrappers.TransformObservation(env, lambda obs: obs.astype(np.float32, copy=False))
+                env.observation_space = gym.spaces.Box(low=obs_space.low.astype(np.float32),
+                                                       high=obs_space.high.astype(np.float32),
+                                                       dtype=np.float32)
+
+            if record_video:
                 if not os.path.isdir(f"{output_dir}/videos"):
                     os.mkdir(f"{output_dir}/videos")
                 env = gym.wrappers.RecordVideo(env, f"{output_dir}/videos",
@@ -387,6 +399,7 @@ def get_envs(n_envs, gym_id, seed, capture_video, output_dir, frame_stack=1, asy
 
             if frame_stack > 1:
                 env = gym.wrappers.FrameStack(env, num_stack=frame_stack)
+            # episode statistics reach the training loop through step infos, which are therefore never dropped
             env = gym.wrappers.RecordEpisodeStatistics(env)
             return env
 
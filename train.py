@@ -26,6 +26,8 @@ def get_args():
                              'env index')
     parser.add_argument('--test-envs', type=int, default=5,
                         help='number of testing environments')
+    parser.add_argument('--async-envs', action=argparse.BooleanOptionalAction, default=False,
+                        help='if set, training envs are stepped in parallel subprocesses')
     parser.add_argument('--video', action=argparse.BooleanOptionalAction, default=False,
                         help='number of parallel envs for vectorized environment')
 
@@ -79,8 +81,10 @@ if __name__ == "__main__":
     if args.cfg_file:
         gin.parse_config_file(args.cfg_file)
     train_envs = get_envs(n_envs=args.num_envs, seed=args.seed, gym_id=args.gym_id,
-                          capture_video=args.video, output_dir=args.output_dir)
+                          capture_video=args.video, output_dir=args.output_dir, async_envs=args.async_envs)
     test_envs = get_envs(n_envs=args.test_envs, seed=args.seed, gym_id=args.gym_id,
                          capture_video=args.video, output_dir=args.output_dir)
     agent = get_agent(args.agent, train_envs, output_dir=args.output_dir, gym_id=args.gym_id)
     agent, scores = train_agent(agent, train_envs, test_envs, seed=args.seed, output_dir=args.output_dir)
+    train_envs.close()
+    test_envs.close()